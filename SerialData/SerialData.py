@@ -16,16 +16,28 @@ limitations under the License.
 
 import numpy as np
 import os
-import re
+import shutil
 import time
 import serial
 import time
 from datetime import datetime
 from threading import Thread, Event
 
+from SerialData.classes.BinaryParser import BinaryParser
 from SerialData.classes.Data import Data
 from SerialData.classes.DataMean import DataMean
+from SerialData.classes.FileWriter import FileWriter
+from SerialData.classes.FrameHistory import FrameHistory
+from SerialData.classes.FrameParser import FrameParser
+from SerialData.classes.FrameTiming import FrameTiming
+from SerialData.classes.Pipeline import Pipeline
+from SerialData.classes.PixelMask import PixelMask
 from SerialData.classes.Noise import Noise
+from SerialData.classes.SessionManifest import SessionManifest
+from SerialData.classes.SessionRecorder import SessionRecorder
+from SerialData.classes.Subscription import Subscription
+from SerialData.classes.Transfer import Transfer
+from SerialData.helper.Calibration import calibration
 
 
 class SerialData:
@@ -36,17 +48,35 @@ class SerialData:
     ### Data collection
     data: Data = None
     mean: DataMean = None
-
-    _data_function = lambda _, _data: _data # two arguments passed
+    history: FrameHistory = None
+    _history_depth: int = 0
+    timing: FrameTiming = None # Always on, arrival intervals and dropped frames
+    recorder: SessionRecorder = None
+    _recording_metadata: dict = None
+    writer: FileWriter = None # All file writes run in its thread
+    _manifests: dict = None # SessionManifest per directory
+
+    _parser: FrameParser = None
+    _binary_parser: BinaryParser = None
+    _bulk_read: bool = False
+    _binary: bool = False
+    _threaded: bool = True
+    _buffer: bytearray = None
+    pipeline: Pipeline = None # Processing of every frame before data and mean, see set_data_function
 
     _counter: int = 0
     _avg_count: int = 0 # Rolling average
+    _avg_mode: str = 'exponential'
+
+    ### Data events for display, do not use for data acquisition, see subscribe()
+    new_data_event: Event = None
+    _first_data_event: Event = None
+    _avg_count_reached_event: Event = None
+    _noise_calculated_event: Event = None
 
-    ### Data events for display, do not use for data acquisition
-    new_data_event: Event = Event()
-    _first_data_event: Event = Event()
-    _avg_count_reached_event: Event = Event()
-    _noise_calculated_event: Event = Event()
+    ### Subscribers with their own buffer, the list is replaced and never changed in place
+    _subscriptions: list = None
+    _published: int = 0 # Frames published since start, sequence number of the next one
 
     # Data dimensions
     _shape: tuple = None
@@ -59,17 +89,53 @@ class SerialData:
     ### Offset, scaling
     _offset: np.ndarray = None
     _scaling: np.ndarray = None
+    # Manifest number of the saved or loaded file, None if measured or unset
+    _offset_version: int = None
+    _scaling_version: int = None
+
+    ### Transfer function per element, calibration stage of the pipeline right after the data function
+    _transfer: Transfer = None
+    _transfer_version: int = None
+    _calibration_levels: list = None
+    _calibration_inputs: list = None
+    calibration_residual: np.ndarray = None # Rms residual of the last fit per element, None if exactly determined
+
+    ### Bad elements, replaced by the mask stage of the pipeline
+    _mask: PixelMask = None
+    _mask_version: int = None
 
     ### Noise
     noise: Noise = None
 
 
-    def __init__(self, port: str, avg_count: int = 3):
+    def __init__(self, port: str, avg_count: int = 3, bulk_read: bool = False, binary: bool = False, threaded: bool = True):
         """
         Continously reads from serial port and parses data received in CSV format.
+        Bulk read drains the serial buffer and decodes all waiting frames at once, useful for small frames at high rate.
+        Binary additionally accepts binary frames next to CSV lines, it implies bulk read.
+        Without thread the port is only opened, reading is then driven from outside, see SerialHub.
             # this data function should typically be done on the ESP
         """
         self._avg_count = max(avg_count, 2) # At least 2 for averaging
+        self._bulk_read = bulk_read
+        self._binary = binary
+        self._threaded = threaded
+        self._parser = FrameParser()
+        self._binary_parser = BinaryParser()
+        self.timing = FrameTiming()
+        self.writer = FileWriter()
+        self._manifests = {}
+
+        # Events per instance, several devices must not share them
+        self.new_data_event = Event()
+        self._first_data_event = Event()
+        self._avg_count_reached_event = Event()
+        self._noise_calculated_event = Event()
+        self._subscriptions = []
+        self.pipeline = Pipeline()
+        self._calibration_levels = []
+        self._calibration_inputs = []
+
         self.start_serial(port)
 
 
@@ -79,12 +145,21 @@ class SerialData:
         # Set stop flag for while loop
         self.__stopped = True
         self._ser.close()
+        self.stop_recording()
+        # Wake waiting subscribers
+        for _subscription in self._subscriptions:
+            _subscription.close()
+        # Finish pending writes
+        self.writer.close()
         print("Serial closed.")
 
     def start_serial(self, port: str) -> None:
         self.__stopped = False
-        self._ser = serial.Serial(port, 115200, timeout=1)
-        Thread(target=self._serial_thread, args=(self._ser,)).start()
+        # Also accepts pyserial URLs, e.g. loop:// for testing without device
+        self._ser = serial.serial_for_url(port, 115200, timeout=1)
+        if self._threaded:
+            _target = self._serial_thread_chunked if self._bulk_read or self._binary else self._serial_thread
+            Thread(target=_target, args=(self._ser,)).start()
         print("Serial opened.")
 
     def wait_for_serial(self) -> None:
@@ -101,6 +176,8 @@ class SerialData:
         # Clear any serial buffer, read possbily partial first line
         ser.flushInput()
         ser.readline()
+        self._start_stats()
+        _cpu_ns = time.thread_time_ns()
 
         _line = ''
         while True:
@@ -109,66 +186,270 @@ class SerialData:
                 break
 
             try:
-                _line = ser.readline().decode('utf-8').strip()
+                _line = ser.readline()
+                # Stamp at arrival, before any decoding
+                _arrival_ns = time.monotonic_ns()
+                _line = _line.decode('utf-8').strip()
             except:
                 continue
 
             if _line == '': # Ignore empty lines
                 continue
 
-            # Strip any ANSI codes
-            _line = re.sub(r'\x1b\[[\d;]*\d+m', '', _line)
-            # _line = re.sub(r'\x1b\[([0-9,A-Z]{1,2}(;[0-9]{1,2})?(;[0-9]{3})?)?[m|K]?', '', _line)
-
-            # Ignore messages not matching expected CSV content
-            #   0:07:42 [D] -13,-124,333;-13,-124,333;
-            #   -13,-124,333;-13,-124,333;
-            _newData = re.search(r"(?:[-?\d+{,|;}]*-?\d+;)", _line)
-            if _newData is None:
+            # Strip ANSI codes, match CSV content and convert to numpy array
+            _data = self._parser.parse(_line)
+            if _data is None:
                 continue
 
-            try:
-                _data = np.array([list(map(float, row.split(','))) for row in _newData[0].split(';') if row])
-            except:
-                print("Data not numpy array.") # This should never happen
-                continue
-
-            # Apply any data conversion, e.g. 1/data ...
-            _data = self._data_function(_data)
-
-            # Called during first run and after clear_data()
-            if self.data is None:
+            self.timing.update(_arrival_ns)
+            self._process_frame(_data, _arrival_ns)
+            _cpu_ns = self._update_stats(1, _cpu_ns)
 
-                if len(_data.shape) > 2:
-                    continue
-                self._shape = _data.shape
-                self.size = _data.size
-
-                # Init offset, scaling on very first run but only if not set
-                if self._offset is None:
-                    self._offset = np.zeros(self._shape)
-                if self._scaling is None:
-                    self._scaling = np.ones(self._shape)
-
-                self.data = Data(self._offset, self._scaling)
-                self.mean = DataMean(self._offset, self._scaling, self._avg_count, self._avg_count_reached_event)
+    def _serial_thread_chunked(self, ser: serial.Serial) -> None:
+        """
+        Drain everything waiting on the serial port and convert all complete lines or binary frames in one batch.
+        Start in thread for continous read.
+        """
+        self._start_receive(ser)
+        _cpu_ns = time.thread_time_ns()
 
-                self._first_data_event.set()
+        while True:
+            # Check for stop flag
+            if self.__stopped is True:
+                break
 
-            # Update data storing classes
-            self.data.update(_data)
-            self.mean.update(_data)
+            try:
+                # Blocks for at least one byte up to the timeout
+                _chunk = ser.read(max(ser.in_waiting, 1))
+                _arrival_ns = time.monotonic_ns()
+            except:
+                continue
 
-            if self.noise is not None:
-                self.noise.update(self.data.scaled(), self.mean.scaled())
+            _cpu_ns = self._update_stats(self._receive(_chunk, _arrival_ns), _cpu_ns)
 
-            # Set the event flag
-            self.new_data_event.set()
+    def _start_receive(self, ser: serial.Serial) -> None:
+        # Clear any serial buffer, a partial first line or frame is dropped
+        ser.flushInput()
+        self._buffer = None
+        self._binary_parser.reset()
+        self._start_stats()
 
+    def _receive(self, chunk: bytes, arrival_ns: int = None) -> int:
+        """
+        Decode and process a chunk of received bytes, returns the number of processed frames.
+        Incomplete lines or frames are kept for the next chunk. All frames share the arrival time of the chunk.
+        """
+        if arrival_ns is None:
+            arrival_ns = time.monotonic_ns()
+        _sequence = None
+        if self._binary:
+            _frames, _lines = self._binary_parser.feed(chunk)
+            # Device sequence numbers only help if every frame has one
+            if len(_frames) > 0 and None not in self._binary_parser.sequences:
+                _sequence = self._binary_parser.sequences[-1]
+        else:
+            # Skip the possibly partial first line
+            if self._buffer is None:
+                _start = chunk.find(b'\n')
+                if _start < 0:
+                    return 0
+                self._buffer = bytearray()
+                chunk = chunk[_start + 1:]
+
+            # Keep the partial trailing line for the next round
+            self._buffer += chunk
+            _end = self._buffer.rfind(b'\n')
+            if _end < 0:
+                return 0
+            _frames = []
+            _lines = self._buffer[:_end].decode('utf-8', errors='replace').splitlines()
+            del self._buffer[:_end + 1]
+
+        # Binary frames, same shape can be processed at once
+        if len(_frames) == 1:
+            self._process_frame(_frames[0], arrival_ns)
+        elif len(_frames) > 1:
+            if all(_frame.shape == _frames[0].shape for _frame in _frames):
+                self._process_batch(np.stack(_frames), arrival_ns)
+            else:
+                for _frame in _frames:
+                    self._process_frame(_frame, arrival_ns)
+
+        # Strip ANSI codes, match CSV content and convert to numpy array of frames
+        _csv_frames = self._parser.parse_batch(_lines) if len(_lines) > 0 else None
+        if _csv_frames is not None:
+            self._process_batch(_csv_frames, arrival_ns)
+
+        # Drops are counted from the sequence of the binary frames, also if CSV lines came in between
+        _frame_count = len(_frames) + (0 if _csv_frames is None else len(_csv_frames))
+        self.timing.update(arrival_ns, _frame_count, _sequence, len(_frames))
+        return _frame_count
+
+    def _process_frame(self, data: np.ndarray, timestamp_ns: int = None) -> None:
+        # Apply any data conversion, e.g. 1/data ...
+        try:
+            _data = self.pipeline.run(data)
+        except ValueError:
+            # Operands of a stage do not fit a frame that changed shape, such frames are ignored anyway
+            return
+
+        # Called during first run and after clear_data()
+        if self.data is None:
+
+            if len(_data.shape) > 2:
+                return
+            self._shape = _data.shape
+            self.size = _data.size
+
+            # Init offset, scaling on very first run but only if not set
+            if self._offset is None:
+                self._offset = np.zeros(self._shape)
+            if self._scaling is None:
+                self._scaling = np.ones(self._shape)
+
+            # A mask from before a shape change does not fit
+            _mask = self._mask if self._mask is not None and self._mask.shape == self._shape else None
+            self.data = Data(self._offset, self._scaling, _mask)
+            self.mean = DataMean(self._offset, self._scaling, self._avg_count, self._avg_count_reached_event, self._avg_mode, _mask)
+            if self._history_depth > 0:
+                self.history = FrameHistory(self._history_depth, self._offset, self._scaling)
+
+            self._first_data_event.set()
+
+        # Ignore frames that changed shape since acquisition start
+        if _data.shape != self._shape:
+            return
+
+        # Update data storing classes
+        self.data.update(_data, timestamp_ns)
+        self.mean.update(_data)
+        if self.history is not None:
+            self.history.append(_data, timestamp_ns)
+        if self.recorder is not None:
+            self.recorder.record(_data, timestamp_ns)
+
+        if self._measuring_noise():
+            self.noise.update(self.data.scaled(), self.mean.scaled(), timestamp_ns)
+
+        # Set the event flag
+        self.new_data_event.set()
+        self._publish(_data, timestamp_ns)
+
+        # Increment counter, this is done at the end because of this stupid indexing from 0
+        self._counter += 1
+
+    def _process_batch(self, frames: np.ndarray, timestamp_ns: int = None) -> None:
+        """
+        Update data storing classes with several frames at once, first axis is the frame index.
+        The pipeline is applied to the whole batch, its stages thus need to work element-wise.
+        """
+        # First frame initializes the data storing classes
+        if self.data is None:
+            self._process_frame(frames[0], timestamp_ns)
+            frames = frames[1:]
+            if self.data is None or len(frames) == 0:
+                return
+
+        # Noise history needs every single frame and mean, single frames are quicker on their own
+        if (self._measuring_noise() and self.noise.keeps_history()) or len(frames) == 1:
+            for _data in frames:
+                self._process_frame(_data, timestamp_ns)
+            return
+
+        # Apply any data conversion, e.g. 1/data ...
+        try:
+            frames = self.pipeline.run(frames, batch=True)
+        except ValueError:
+            return
+
+        # Ignore frames that changed shape since acquisition start
+        if frames.shape[1:] != self._shape:
+            return
+
+        # Update data storing classes
+        self.data.update_batch(frames, timestamp_ns)
+        self.mean.update_batch(frames)
+        if self.history is not None:
+            self.history.append_batch(frames, timestamp_ns)
+        if self.recorder is not None:
+            self.recorder.record_batch(frames, timestamp_ns)
+
+        if self._measuring_noise():
+            self.noise.update_batch((frames + self._offset) * self._scaling, timestamp_ns)
+
+        # Set the event flag
+        self.new_data_event.set()
+        self._publish_batch(frames, timestamp_ns)
+
+        self._counter += len(frames)
+
+
+### Subscriptions ##########################################################################
+
+    def subscribe(self, policy: str = 'keep_latest', max_frames: int = 1) -> Subscription:
+        """
+        Own buffer of the frames after the pipeline, see Subscription for the policies.
+        A blocking subscriber that does not read stalls acquisition, unsubscribe when done.
+        """
+        _subscription = Subscription(policy, max_frames)
+        self._subscriptions = self._subscriptions + [_subscription]
+        return _subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.close()
+        self._subscriptions = [_subscription for _subscription in self._subscriptions if _subscription is not subscription]
+
+    def wait_for_average(self, timeout: float = None) -> bool:
+        # Wait until avg_count frames are averaged after the last restart, False on timeout
+        return self._avg_count_reached_event.wait(timeout)
+
+    def _publish(self, data: np.ndarray, timestamp_ns: int) -> None:
+        _subscriptions = self._subscriptions
+        if len(_subscriptions) > 0:
+            # One read-only copy for all, the data buffer is re-used
+            _frame = np.array(data)
+            _frame.flags.writeable = False
+            for _subscription in _subscriptions:
+                _subscription.put(self._published, timestamp_ns, _frame)
+        self._published += 1
+
+    def _publish_batch(self, frames: np.ndarray, timestamp_ns: int) -> None:
+        _subscriptions = self._subscriptions
+        if len(_subscriptions) > 0:
+            _frames = np.array(frames)
+            _frames.flags.writeable = False
+            for _subscription in _subscriptions:
+                _subscription.put_batch(self._published, timestamp_ns, _frames)
+        self._published += len(frames)
+
+
+### Acquisition statistics ##########################################################################
+
+    _stats_start_ns: int = 0
+    _stats_cpu_ns: int = 0
+    _stats_frames: int = 0
+
+    def acquisition_stats(self) -> tuple[float, float]:
+        """
+        Frames per second and CPU time of the serial thread per frame in microseconds, since serial start.
+        """
+        if self._stats_frames == 0:
+            return 0.0, 0.0
+        _elapsed_s = (time.monotonic_ns() - self._stats_start_ns) / 1e9
+        return self._stats_frames / _elapsed_s, self._stats_cpu_ns / self._stats_frames / 1000
 
+    def _start_stats(self) -> None:
+        self._stats_start_ns = time.monotonic_ns()
+        self._stats_cpu_ns = 0
+        self._stats_frames = 0
+        self.timing.reset()
 
-            # Increment counter, this is done at the end because of this stupid indexing from 0
-            self._counter += 1
+    def _update_stats(self, frame_count: int, cpu_ns: int) -> int:
+        # Called from within the serial thread, thread time is per thread, returns the new reference
+        _now_ns = time.thread_time_ns()
+        self._stats_frames += frame_count
+        self._stats_cpu_ns += _now_ns - cpu_ns
+        return _now_ns
 
 
 ### General ##########################################################################
@@ -179,12 +460,36 @@ class SerialData:
         self._first_data_event.wait()
 
     def set_data_function(self, data_function) -> None:
-        self._data_function = data_function
+        """
+        Any function of the frame, first stage of the pipeline, None removes it. It may change the shape, thus the
+        acquisition restarts. Stages changed on the pipeline itself take effect with the next frame, e.g.
+            serialData.pipeline.append('reciprocal', np.reciprocal)
+            serialData.pipeline.append('clip', np.clip, 0, 1000)
+            serialData.pipeline.set('clip', 0, 500)
+        """
+        if data_function is None:
+            self.pipeline.remove('data_function')
+        else:
+            self.pipeline.insert(0, 'data_function', data_function, fused=False)
+        self._clear_data()
+
+    def set_average_mode(self, mode: str) -> None:
+        # Exponential rolling average, boxcar mean of the last frames, or cumulative mean since start
+        if mode not in DataMean.modes:
+            print("Warning: Unknown averaging mode.")
+            return
+        self._avg_mode = mode
+        self._clear_data()
+
+    def set_history(self, depth: int) -> None:
+        # Keep the last frames in a ring buffer, zero to disable
+        self._history_depth = depth
         self._clear_data()
 
     def _clear_data(self) -> None:
         self.data = None
         self.mean = None
+        self.history = None
 
         self.new_data_event.clear()
         self._first_data_event.clear()
@@ -198,20 +503,34 @@ class SerialData:
     path_to_data = "data/"
     path_to_offset = f"{path_to_data}/offset/"
     path_to_scaling = f"{path_to_data}/scaling/"
+    path_to_calibration = f"{path_to_data}/calibration/"
+    path_to_mask = f"{path_to_data}/mask/"
 
-    def measure_noise(self, noise_max_count: int = 100) -> None:
-        self.noise = Noise(noise_max_count, self._noise_calculated_event)
+    def measure_noise(self, noise_max_count: int = 100, history_step: int = 0) -> None:
+        """
+        Noise statistics are calculated live, history_step keeps every n-th frame for plotting, zero keeps none.
+        The history costs three arrays of noise_max_count / history_step frames, and batches are then processed frame
+        by frame. The result stays in noise, frames after the measurement are not added.
+        """
+        self._noise_calculated_event.clear()
+        self.noise = Noise(noise_max_count, self._noise_calculated_event, history_step)
         print("Measuring noise ...")
         self._measure_mean_with_progress(noise_max_count)
 
-        # Measuring done, wait for calculation to finish
+        # Measuring done, wait for last frame
         self._noise_calculated_event.wait()
 
-        # Save recorded noise data
-        self.write_timestamped_csv(self.noise.uncertainty, "noise_u")
-        self.write_timestamped_csv(self.noise.data_historic, "noise_datas")
-        self.write_timestamped_csv(self.noise.mean_historic, "noise_means")
+        # Save noise statistics: mean, standard deviation, uncertainty
+        self.write_timestamped_csv(np.array([self.noise.mean, self.noise.standard_deviation(), self.noise.standard_uncertainty()]), "noise_stats")
         self.write_timestamped_csv(self.noise.timings, "noise_timings")
+        # Save recorded noise data
+        if history_step > 0:
+            self.write_timestamped_csv(self.noise.uncertainty, "noise_u")
+            self.write_timestamped_csv(self.noise.data_historic, "noise_datas")
+            self.write_timestamped_csv(self.noise.mean_historic, "noise_means")
+
+    def _measuring_noise(self) -> bool:
+        return self.noise is not None and self.noise.finished() is False
 
     def measure_offset(self, avgCountOffset: int = 10, targetValue: int = 0) -> None:
         print("Measuring offset ...")
@@ -219,6 +538,7 @@ class SerialData:
 
         # Offset is just the mean data minus target value
         self._offset = self.mean.raw() - targetValue
+        self._offset_version = None
 
         # Restart data acquisition
         self.restart_data_acquisition()
@@ -234,10 +554,66 @@ class SerialData:
             _row = index // self.sizeX()
             _col = index % self.sizeX()
             self._scaling[_row, _col] = targetValue / self.mean.offcor()[_row, _col]
+        self._scaling_version = None
 
         # Restart data acquisition
         self.restart_data_acquisition()
 
+    def measure_flat_field(self, target = None, avg_count: int = 10, reject_sigma: float = 3.) -> None:
+        """
+        Scaling of all elements in one run from a uniform stimulus, or from a known reference frame as target.
+        Offset corrected frames are averaged per element without outliers, see Calibration.clipped_mean. The scaling
+        turns this mean into the target, by default into the median over all elements. Measure the offset first.
+        """
+        print("Measuring flat field ...")
+        _frames = self._collect_frames(avg_count)
+        np.add(_frames, self._offset, out=_frames)
+        _scaling = calibration.flat_field(calibration.clipped_mean(_frames, reject_sigma), target)
+
+        # Elements without signal keep their scaling, in place as data and mean share the array
+        _invalid = np.isnan(_scaling)
+        if np.any(_invalid):
+            print(f"Warning: {np.count_nonzero(_invalid)} elements without signal, scaling not changed.")
+        np.copyto(self._scaling, _scaling, where=~_invalid)
+        self._scaling_version = None
+
+        # Restart data acquisition
+        self.restart_data_acquisition()
+
+    def measure_bad_pixels(self, avg_count: int = 100, reject_sigma: float = 5., uniform: bool = True, mode: str = 'interpolate') -> None:
+        """
+        Mask of elements that stand out in noise, min/max range and the calibration residual if fitted, see
+        Calibration.bad_pixels. Uniform also checks the mean, measure under a uniform stimulus then, e.g. dark.
+        Bad elements are interpolated from their neighbours, or set to NaN with mode ignore, see PixelMask.
+        """
+        print("Measuring bad pixels ...")
+        # Frames as received, without the current mask
+        if 'mask' in self.pipeline:
+            self.pipeline.enable('mask', False)
+        _frames = self._collect_frames(avg_count)
+        if 'mask' in self.pipeline:
+            self.pipeline.enable('mask', True)
+        _residual = self.calibration_residual if self._transfer is not None else None
+        _mask = calibration.bad_pixels(_frames, _residual, reject_sigma, uniform)
+        print(f"{np.count_nonzero(_mask)} of {_mask.size} elements bad.")
+        self.set_mask(_mask, mode)
+
+    def _collect_frames(self, count: int) -> np.ndarray:
+        # The next count frames after the pipeline, without restarting the acquisition
+        _subscription = self.subscribe('drop_oldest', count)
+        _frames = np.zeros((count,) + self._shape)
+        _collected = 0
+        while _collected < count and _subscription.closed is False:
+            _item = _subscription.get(timeout=1)
+            if _item is None or _item[2].shape != self._shape:
+                continue
+            _frames[_collected] = _item[2]
+            _collected += 1
+            print(f"{_collected}/{count}", end='\r')
+        self.unsubscribe(_subscription)
+        print()
+        return _frames[:_collected]
+
     def _measure_mean_with_progress(self, avg_count: int) -> None:
         # Remember averaging count
         _sample_avg_count = self._avg_count
@@ -246,11 +622,16 @@ class SerialData:
         self._avg_count = avg_count
         self._clear_data()
 
-        while self._avg_count_reached_event.is_set() is False:
+        _subscription = self.subscribe()
+        while self._avg_count_reached_event.is_set() is False and _subscription.closed is False:
             # Wait for measurement
-            self.new_data_event.wait()
-            self.new_data_event.clear()
-            print(f"{self._counter}/{avg_count}", end='\r')
+            if _subscription.get(timeout=1) is None:
+                continue
+            if self.noise is not None and self.noise.count > 1:
+                print(f"{self._counter}/{avg_count}, median standard deviation {np.median(self.noise.standard_deviation()):.3g}", end='\r')
+            else:
+                print(f"{self._counter}/{avg_count}", end='\r')
+        self.unsubscribe(_subscription)
 
         # Set averaging to original count
         self._avg_count = _sample_avg_count
@@ -258,18 +639,21 @@ class SerialData:
     def load_offset(self) -> None:
         _offset = self._read_npy(f"{self.path_to_offset}offset")
         if _offset is not None:
-            self.set_offset(_offset)
+            self.set_offset(_offset, self._saved_version(self.path_to_offset, "offset"))
         else:
             print("Offset not found.")
 
     def save_offset(self) -> None:
-        self._write_npy(self._offset, f"{self.path_to_offset}offset")
+        self._write_npy(self._offset, f"{self.path_to_offset}offset", '_offset_version')
+        # Rare, wait for it so the version is known to files saved next
+        self.writer.flush()
         print("Offset saved.")
 
-    def set_offset(self, offset: np.ndarray) -> None:
+    def set_offset(self, offset: np.ndarray, version: int = None) -> None:
         if offset.shape == self._offset.shape:
             print("Offset loaded.")
             self._offset = offset
+            self._offset_version = version
             self._clear_data()
             # Wait for measurements to start to not mess with plot and such
             self._first_data_event.wait()
@@ -279,66 +663,240 @@ class SerialData:
     def load_scaling(self) -> None:
         _scaling = self._read_npy(f"{self.path_to_scaling}scaling")
         if _scaling is not None:
-            self.set_scaling(_scaling)
+            self.set_scaling(_scaling, self._saved_version(self.path_to_scaling, "scaling"))
         else:
             print("Scaling not found.")
             print(f"{self.path_to_scaling}scaling")
 
     def save_scaling(self) -> None:
-        self._write_npy(self._scaling,f"{self.path_to_scaling}scaling")
+        self._write_npy(self._scaling, f"{self.path_to_scaling}scaling", '_scaling_version')
+        # Rare, wait for it so the version is known to files saved next
+        self.writer.flush()
         print("Scaling saved.")
 
-    def set_scaling(self, scaling: np.ndarray) -> None:
+    def set_scaling(self, scaling: np.ndarray, version: int = None) -> None:
         if scaling.shape == self._scaling.shape:
             print("Scaling loaded.")
             self._scaling = scaling
+            self._scaling_version = version
             self._clear_data()
             # Wait for measurements to start to not mess with plot and such
             self._first_data_event.wait()
         else:
             print("Warning: Scaling shape mismatch.")
 
+    def measure_calibration_point(self, level, avg_count: int = 10, reject_sigma: float = 3.) -> None:
+        """
+        Averaged frame at a known stimulus level, a value or a reference frame, for fit_calibration. The current
+        transfer function is not applied while measuring. Outliers are left out, see Calibration.clipped_mean.
+        """
+        print(f"Measuring calibration point {len(self._calibration_levels) + 1} ...")
+        if 'calibration' in self.pipeline:
+            self.pipeline.enable('calibration', False)
+        _frames = self._collect_frames(avg_count)
+        if 'calibration' in self.pipeline:
+            self.pipeline.enable('calibration', True)
+
+        self._calibration_levels.append(np.broadcast_to(np.asarray(level, dtype=float), self._shape))
+        self._calibration_inputs.append(calibration.clipped_mean(_frames, reject_sigma))
+
+    def clear_calibration_points(self) -> None:
+        self._calibration_levels = []
+        self._calibration_inputs = []
+
+    def fit_calibration(self, degree: int = 1) -> None:
+        """
+        Polynomial transfer function of each element from the calibration points, applied to all following frames.
+        Frames then read in units of the stimulus, offset and scaling are applied on top and best left unset.
+        """
+        if degree < 1 or len(self._calibration_levels) < degree + 1:
+            print("Warning: At least degree + 1 calibration points needed, degree at least 1.")
+            return
+        _coefficients, self.calibration_residual = calibration.fit_polynomial(np.stack(self._calibration_inputs), np.stack(self._calibration_levels), degree)
+        if len(self._calibration_levels) == degree + 1:
+            # Exactly determined, the residual is only round-off
+            self.calibration_residual = None
+            print("Calibration fitted, exactly determined, no residual.")
+        else:
+            print(f"Calibration fitted, rms residual median {np.median(self.calibration_residual):.3g}, max {np.max(self.calibration_residual):.3g}.")
+        self.set_calibration(_coefficients)
+
+    def load_calibration(self) -> None:
+        _coefficients = self._read_npy(f"{self.path_to_calibration}calibration")
+        if _coefficients is not None:
+            self.set_calibration(_coefficients, self._saved_version(self.path_to_calibration, "calibration"))
+        else:
+            print("Calibration not found.")
+
+    def save_calibration(self) -> None:
+        if self._transfer is None:
+            print("Warning: No calibration to save.")
+            return
+        self._write_npy(self._transfer.coefficients, f"{self.path_to_calibration}calibration", '_transfer_version')
+        # Rare, wait for it so the version is known to files saved next
+        self.writer.flush()
+        print("Calibration saved.")
+
+    def set_calibration(self, coefficients: np.ndarray, version: int = None) -> None:
+        # Coefficients as from Calibration.fit_polynomial, None removes the transfer function
+        if coefficients is not None and coefficients.shape[1:] != self._shape:
+            print("Warning: Calibration shape mismatch.")
+            return
+        print("Calibration loaded." if coefficients is not None else "Calibration removed.")
+        self._transfer = None if coefficients is None else Transfer(coefficients)
+        self._transfer_version = version
+        # Right after the data function, before any other stage
+        if self._transfer is None:
+            self.pipeline.remove('calibration')
+        else:
+            self.pipeline.insert(1 if 'data_function' in self.pipeline else 0, 'calibration', self._transfer.evaluate)
+        self._clear_data()
+        # Wait for measurements to start to not mess with plot and such
+        self._first_data_event.wait()
+
+    def load_mask(self, mode: str = 'interpolate') -> None:
+        _mask = self._read_npy(f"{self.path_to_mask}mask")
+        if _mask is not None:
+            self.set_mask(_mask, mode, self._saved_version(self.path_to_mask, "mask"))
+        else:
+            print("Mask not found.")
+
+    def save_mask(self) -> None:
+        if self._mask is None:
+            print("Warning: No mask to save.")
+            return
+        self._write_npy(self._mask.mask, f"{self.path_to_mask}mask", '_mask_version')
+        # Rare, wait for it so the version is known to files saved next
+        self.writer.flush()
+        print("Mask saved.")
+
+    def set_mask(self, mask: np.ndarray, mode: str = 'interpolate', version: int = None) -> None:
+        # True for bad elements, None removes the mask
+        if mask is not None and mask.shape != self._shape:
+            print("Warning: Mask shape mismatch.")
+            return
+        if mode not in PixelMask.modes:
+            print("Warning: Unknown mask mode.")
+            return
+        print("Mask loaded." if mask is not None else "Mask removed.")
+        self._mask = None if mask is None else PixelMask(mask, mode)
+        self._mask_version = version
+        # After data function and calibration, before any other stage, all consumers get the masked frames
+        if self._mask is None:
+            self.pipeline.remove('mask')
+        else:
+            self.pipeline.insert(len([_name for _name in ('data_function', 'calibration') if _name in self.pipeline]), 'mask', self._mask.apply)
+        self._clear_data()
+        # Wait for measurements to start to not mess with plot and such
+        self._first_data_event.wait()
+
+    def bad_pixels(self) -> np.ndarray:
+        # Coordinates of the masked elements, one row each
+        if self._mask is None:
+            return np.zeros((0, len(self._shape)), dtype=int)
+        return np.argwhere(self._mask.mask)
+
 
 ### Read, write files ##########################################################################
 
     def _read_npy(self, filename: str) -> np.ndarray:
+        # Pending writes first, the file may just have been saved
+        self.writer.flush()
         # Load and return the array from the file
         filename = f"{filename}.npy"
         if os.path.exists(filename):
             return np.load(filename)
         return None
 
-    def _write_npy(self, array: np.ndarray, filename: str) -> None:
-        _extension = ".npy"
-        _fullfilename = filename + _extension
-
-        # Check if the file exists, rename using incremental counter if so
-        if os.path.exists(_fullfilename):
-            os.rename(_fullfilename, self._get_next_filename(filename, _extension))
-
-        # Save the array to a file
-        np.save(_fullfilename, array)
-        print(f"Array saved to {_fullfilename}")
+    def _write_npy(self, array: np.ndarray, filename: str, version_attribute: str = None) -> None:
+        # Written in the writer thread, the array is copied as it may change in the meantime
+        self.writer.submit(self._write_npy_now, np.array(array), filename, version_attribute, self._metadata(array, os.path.basename(filename)))
 
-    def write_incremental_csv(self, array: np.ndarray, filename: str) -> None:
+    def _write_npy_now(self, array: np.ndarray, filename: str, version_attribute: str = None, metadata: dict = None) -> None:
+        _extension = ".npy"
+        _path, _name = os.path.split(filename)
+        _manifest = self.manifest(_path)
+
+        # Every version is kept numbered, the plain filename is a copy of the latest
+        _numbered, _number = _manifest.reserve(_name, _extension)
+        np.save(_numbered, array)
+        shutil.copyfile(_numbered, filename + _extension)
+        _manifest.add(_numbered, _name, _number, **(metadata or {'shape': list(array.shape)}))
+        if version_attribute is not None:
+            setattr(self, version_attribute, _number)
+        print(f"Array saved to {filename + _extension}")
+
+    def start_recording(self, filename: str) -> None:
+        # Record every frame after the pipeline with its arrival timestamp, see SessionRecorder
+        self.stop_recording()
+        _timestamp = datetime.now().isoformat(timespec='seconds')
+        self.recorder = SessionRecorder(f"{self.path_to_data}{filename}_{_timestamp}", writer=self.writer)
+        self._recording_metadata = self._metadata(None, filename)
+
+    def stop_recording(self) -> None:
+        _recorder = self.recorder
+        self.recorder = None
+        if _recorder is not None:
+            _recorder.close()
+            # After the files are closed, with the final frame count
+            self.writer.submit(self._add_recording_now, _recorder, self._recording_metadata)
+
+    def _add_recording_now(self, recorder: SessionRecorder, metadata: dict) -> None:
+        if recorder.frames == 0:
+            return
+        _path, _name = os.path.split(recorder.filename)
+        self.manifest(_path).add(f"{_name}.npy", _name, frames=recorder.frames, **{**metadata, 'shape': list(recorder._shape)})
+
+    def write_incremental_csv(self, array: np.ndarray, filename: str, description: str = None) -> None:
+        # Numbered in the writer thread, after all earlier writes are done
+        self.writer.submit(self._write_incremental_csv_now, np.array(array), filename, self._metadata(array, description or filename))
+
+    def _write_incremental_csv_now(self, array: np.ndarray, filename: str, metadata: dict) -> None:
         # All files are numbered, there is no not-numbered first file
         _extension = ".csv"
-        np.savetxt(self._get_next_filename(f"{self.path_to_data}{filename}", _extension), array, delimiter=",")
+        _manifest = self.manifest()
+        _filename, _number = _manifest.reserve(filename, _extension)
+        np.savetxt(_filename, array, delimiter=",")
+        _manifest.add(_filename, filename, _number, **metadata)
         # array = np.loadtxt(filename, delimiter=",")
 
-    def write_timestamped_csv(self, array: np.ndarray, filename: str) -> None:
+    def write_timestamped_csv(self, array: np.ndarray, filename: str, description: str = None) -> None:
         _extension = ".csv"
         # Get the current date and time in ISO format
         _timestamp = datetime.now().isoformat(timespec='seconds') # 'timespec' for Python 3.6+
         _fullfilename = f"{self.path_to_data}{filename}_{_timestamp}{_extension}"
         # Any existing file is just overwritten without warning
-        np.savetxt(_fullfilename, array, delimiter=",")
-
-    def _get_next_filename(self, filename: str, extension: str) -> None:
-        # Check if the file exists, and find the next available filename if so
-        _counter = 1
-        _filename = f"{filename}_{_counter}{extension}"
-        while os.path.exists(_filename):
-            _filename = f"{filename}_{_counter}{extension}"
-            _counter += 1
-        return _filename
+        self.writer.submit(self._write_csv_now, np.array(array), _fullfilename, filename, self._metadata(array, description or filename))
+
+    def _write_csv_now(self, array: np.ndarray, filename: str, name: str, metadata: dict) -> None:
+        np.savetxt(filename, array, delimiter=",")
+        self.manifest().add(filename, name, **metadata)
+
+    def manifest(self, path: str = None) -> SessionManifest:
+        """
+        Manifest of the files saved to a directory, path_to_data by default. Query it instead of listing the directory:
+            serialData.manifest().entries(name='sample')
+            serialData.manifest(serialData.path_to_offset).latest('offset')
+        """
+        _path = os.path.normpath(self.path_to_data if path is None else path)
+        if _path not in self._manifests:
+            self._manifests[_path] = SessionManifest(_path)
+        return self._manifests[_path]
+
+    def _metadata(self, array: np.ndarray, description: str) -> dict:
+        # Taken when the write is queued, versions of offset and scaling saved or loaded so far
+        return {
+            'shape': None if array is None else list(np.shape(array)),
+            'avg_count': self._avg_count,
+            'avg_mode': self._avg_mode,
+            'offset_version': self._offset_version,
+            'scaling_version': self._scaling_version,
+            'calibration_version': self._transfer_version,
+            'mask_version': self._mask_version,
+            'description': description,
+        }
+
+    def _saved_version(self, path: str, name: str) -> int:
+        # Number of the latest saved file, None if saved before there was a manifest
+        _entry = self.manifest(path).latest(name)
+        return None if _entry is None else _entry['number']
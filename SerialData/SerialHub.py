@@ -0,0 +1,112 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+import selectors
+import time
+from threading import Thread
+
+from SerialData.SerialData import SerialData
+
+
+class SerialHub:
+    """
+    Drives several serial devices from a single thread, waiting on all ports at once with selectors.
+    Each device is a SerialData instance keeping its own data, mean, offset, scaling and events.
+    Works with any port that has a file descriptor, thus not on Windows, but also with pseudo-terminals for testing.
+    """
+
+    devices: list[SerialData] = None
+
+    _selector: selectors.BaseSelector = None
+    __stopped: bool = False
+
+    # Per device time from wakeup of the loop until its bytes are processed, last and max
+    _lag_ns: list[int] = None
+    _lag_max_ns: list[int] = None
+    _stats_start_ns: int = 0
+
+
+    def __init__(self) -> None:
+        self.devices = []
+        self._lag_ns = []
+        self._lag_max_ns = []
+        self._selector = selectors.DefaultSelector()
+
+    def add_device(self, port: str, avg_count: int = 3, binary: bool = False) -> SerialData:
+        # Devices are always read in chunks, there is no blocking readline
+        _device = SerialData(port, avg_count, bulk_read=True, binary=binary, threaded=False)
+        self.devices.append(_device)
+        self._lag_ns.append(0)
+        self._lag_max_ns.append(0)
+        return _device
+
+    def start(self) -> None:
+        self.__stopped = False
+        for _index, _device in enumerate(self.devices):
+            _device._start_receive(_device._ser)
+            self._selector.register(_device._ser.fileno(), selectors.EVENT_READ, _index)
+        self._stats_start_ns = time.monotonic_ns()
+        Thread(target=self._hub_thread).start()
+        print(f"Serial hub started with {len(self.devices)} devices.")
+
+    def stop(self, _ = None) -> None:
+        # Set stop flag for while loop, the loop closes the ports
+        self.__stopped = True
+
+    def wait_for_serial(self) -> None:
+        for _device in self.devices:
+            _device.wait_for_serial()
+
+    def acquisition_stats(self) -> tuple[float, list[tuple[float, float, float]]]:
+        """
+        Aggregate frames per second, and per device frames per second, last and max lag in milliseconds.
+        """
+        _devices = [(_device.acquisition_stats()[0], _lag / 1e6, _lag_max / 1e6) for _device, _lag, _lag_max in zip(self.devices, self._lag_ns, self._lag_max_ns)]
+        return sum(_fps for _fps, _, _ in _devices), _devices
+
+    def _hub_thread(self) -> None:
+        while True:
+            # Check for stop flag, short timeout for a quick shutdown
+            if self.__stopped is True:
+                break
+
+            _ready = self._selector.select(timeout=0.1)
+            _wakeup_ns = time.monotonic_ns()
+            for _key, _ in _ready:
+                _index = _key.data
+                _device = self.devices[_index]
+                _cpu_ns = time.thread_time_ns()
+                try:
+                    _chunk = _device._ser.read(_device._ser.in_waiting)
+                except:
+                    # Port gone, e.g. device unplugged
+                    self._selector.unregister(_key.fileobj)
+                    print(f"Serial {_device._ser.port} lost.")
+                    continue
+                _device._update_stats(_device._receive(_chunk, _wakeup_ns), _cpu_ns)
+
+                _lag = time.monotonic_ns() - _wakeup_ns
+                self._lag_ns[_index] = _lag
+                self._lag_max_ns[_index] = max(self._lag_max_ns[_index], _lag)
+
+        # Unregister and close all ports
+        for _device in self.devices:
+            try:
+                self._selector.unregister(_device._ser.fileno())
+            except:
+                pass
+            _device.stop_serial()
+        print("Serial hub stopped.")
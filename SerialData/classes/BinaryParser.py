@@ -0,0 +1,132 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+import numpy as np
+import struct
+import zlib
+
+
+# Frame layout, all little-endian
+#   sync 0xAA 0x55 | payload length uint32 | dtype code uint8 | rows uint16 | cols uint16 | [sequence uint32] | payload | crc32 of payload uint32
+# 0xAA never appears in ASCII text, thus CSV lines can be sent over the same link. Non-ASCII UTF-8 text may contain
+# the sync bytes, the header checks and the CRC reject such a false frame and parsing resyncs after it, the text line
+# it appeared in may be lost
+# The sequence number is optional, flagged by the high bit of the dtype code, it reveals dropped frames
+_sync = b'\xaa\x55'
+_header = struct.Struct('<2sIBHH')
+_sequence = struct.Struct('<I')
+_sequence_flag = 0x80
+_checksum = struct.Struct('<I')
+
+_dtypes = [np.dtype(_dtype).newbyteorder('<') for _dtype in ('i1', 'u1', 'i2', 'u2', 'i4', 'u4', 'f4', 'f8')]
+
+
+class BinaryParser:
+    """
+    Splits a byte stream into binary frames and CSV text lines.
+    Binary frames are decoded zero-copy with np.frombuffer, the returned arrays are read-only views of the received bytes.
+    Incomplete frames and lines are kept until the next chunk arrives.
+    Sequence numbers of the frames returned by the last feed are in sequences, None for frames without.
+    """
+
+    sequences: list = None
+    _remainder: bytes = None
+
+
+    def feed(self, chunk: bytes) -> tuple[list[np.ndarray], list[str]]:
+        self.sequences = []
+        # After reset skip anything before the first sync or line end, it is possibly partial
+        if self._remainder is None:
+            _starts = [_pos for _pos in (chunk.find(_sync), chunk.find(b'\n')) if _pos >= 0]
+            if len(_starts) == 0:
+                return [], []
+            _start = min(_starts)
+            # Drop the line end itself, keep the sync
+            if chunk[_start] == ord('\n'):
+                _start += 1
+            self._remainder = b''
+            chunk = chunk[_start:]
+
+        _stream = self._remainder + chunk if self._remainder else chunk
+        _view = memoryview(_stream)
+        _frames = []
+        _lines = []
+
+        _pos = 0
+        while _pos < len(_stream):
+            _sync_pos = _stream.find(_sync, _pos)
+            _newline_pos = _stream.find(b'\n', _pos)
+
+            # Text line complete before any binary frame
+            if _newline_pos >= 0 and (_sync_pos < 0 or _newline_pos < _sync_pos):
+                _lines.append(_stream[_pos:_newline_pos].decode('utf-8', errors='replace'))
+                _pos = _newline_pos + 1
+                continue
+
+            # Neither complete line nor frame, wait for more
+            if _sync_pos < 0:
+                break
+
+            # Partial text before the frame is lost anyway
+            _pos = _sync_pos
+            if len(_stream) - _pos < _header.size:
+                break
+            _, _length, _dtype_code, _rows, _cols = _header.unpack_from(_stream, _pos)
+            _has_sequence = _dtype_code & _sequence_flag
+            _dtype_code &= ~_sequence_flag
+
+            # Not a frame header, resync after the sync bytes
+            if _dtype_code >= len(_dtypes) or _length != _rows * _cols * _dtypes[_dtype_code].itemsize:
+                _pos += len(_sync)
+                continue
+
+            _payload_start = _pos + _header.size + (_sequence.size if _has_sequence else 0)
+            _payload_end = _payload_start + _length
+            if len(_stream) < _payload_end + _checksum.size:
+                break
+
+            # Corrupted frame, resync after the sync bytes
+            (_crc,) = _checksum.unpack_from(_stream, _payload_end)
+            if _crc != zlib.crc32(_view[_payload_start:_payload_end]):
+                _pos += len(_sync)
+                continue
+
+            _frames.append(np.frombuffer(_stream, _dtypes[_dtype_code], _rows * _cols, _payload_start).reshape(_rows, _cols))
+            self.sequences.append(_sequence.unpack_from(_stream, _pos + _header.size)[0] if _has_sequence else None)
+            _pos = _payload_end + _checksum.size
+
+        _view.release()
+        self._remainder = _stream[_pos:]
+        return _frames, _lines
+
+    def reset(self) -> None:
+        self._remainder = None
+
+    def encode(self, array: np.ndarray, sequence: int = None) -> bytes:
+        """
+        Encode a 1D or 2D array as binary frame, mainly for testing, the ESP does the same.
+        """
+        _array = np.atleast_2d(array)
+        _dtype = _array.dtype.newbyteorder('<')
+        if _dtype not in _dtypes:
+            raise ValueError(f"Unsupported dtype {array.dtype}")
+        _payload = _array.astype(_dtype, copy=False).tobytes()
+        if sequence is None:
+            _head = _header.pack(_sync, len(_payload), _dtypes.index(_dtype), _array.shape[0], _array.shape[1])
+        else:
+            _head = _header.pack(_sync, len(_payload), _dtypes.index(_dtype) | _sequence_flag, _array.shape[0], _array.shape[1])
+            _head += _sequence.pack(sequence % 2**32)
+        return _head + _payload + _checksum.pack(zlib.crc32(_payload))
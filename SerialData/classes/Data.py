@@ -17,42 +17,99 @@ limitations under the License.
 import numpy as np
 from threading import Event
 
+from SerialData.classes.PixelMask import PixelMask
+
 
 class Data:
     _offset: np.ndarray = None
     _scaling: np.ndarray = None
 
     _data: np.ndarray = None
+    _timestamp_ns: int = None # Arrival of the current data, time.monotonic_ns()
 
     _fmax: np.ndarray = None
     _fmin: np.ndarray = None
+    _batch_buffer: np.ndarray = None
+
+    # Masked elements may be NaN, see PixelMask
+    _min = staticmethod(np.min)
+    _max = staticmethod(np.max)
 
-    def __init__(self, offset: np.ndarray, scaling: np.ndarray) -> None:
+    # Derived arrays and min/max are computed at most once per update, on first read
+    _version: int = 0
+    _cache: dict = None
+    _offcor: np.ndarray = None
+    _scaled: np.ndarray = None
+    _fmax_scaled: np.ndarray = None
+    _fmin_scaled: np.ndarray = None
+
+    def __init__(self, offset: np.ndarray, scaling: np.ndarray, mask: PixelMask = None) -> None:
         self._offset = offset
         self._scaling = scaling
 
-        self._fmax = np.full_like(offset, -2**32)
-        self._fmin = np.full_like(offset, 2**32)
+        self._fmax = np.full(offset.shape, -2.**32)
+        self._fmin = np.full(offset.shape, 2.**32)
+        # Frames arrive masked already, NaN elements stay NaN in min/max as fmax/fmin skip NaN
+        if mask is not None and mask.count > 0:
+            self._min = np.nanmin
+            self._max = np.nanmax
+            self._fmax[mask.mask] = np.nan
+            self._fmin[mask.mask] = np.nan
+        self._batch_buffer = np.zeros(offset.shape)
+
+        self._cache = {}
+        self._offcor = np.zeros(offset.shape)
+        self._scaled = np.zeros(offset.shape)
+        self._fmax_scaled = np.zeros(offset.shape)
+        self._fmin_scaled = np.zeros(offset.shape)
 
-    def update(self, data: np.ndarray) -> None:
-        self._data = data
-        # Update forever min/max
-        self._fmax = np.fmax(self._fmax, self._data)
-        self._fmin = np.fmin(self._fmin, self._data)
+    def update(self, data: np.ndarray, timestamp_ns: int = None) -> None:
+        # Keep an own copy, the parser re-uses its buffer for the next frame
+        if self._data is None:
+            self._data = np.array(data, dtype=float)
+        else:
+            np.copyto(self._data, data)
+        self._timestamp_ns = timestamp_ns
+        self._update_forever()
 
-    # Read raw, offset corrected, or scaled data
+    def update_batch(self, data: np.ndarray, timestamp_ns: int = None) -> None:
+        # Several frames at once, first axis is the frame index, only the last one is kept
+        self.update(data[-1], timestamp_ns)
+        np.fmax.reduce(data, axis=0, out=self._batch_buffer)
+        np.fmax(self._fmax, self._batch_buffer, out=self._fmax)
+        np.fmin.reduce(data, axis=0, out=self._batch_buffer)
+        np.fmin(self._fmin, self._batch_buffer, out=self._fmin)
+        self._version += 1
+
+    def _update_forever(self) -> None:
+        # Update forever min/max in place, invalidates derived arrays
+        np.fmax(self._fmax, self._data, out=self._fmax)
+        np.fmin(self._fmin, self._data, out=self._fmin)
+        self._version += 1
+
+    def _cached(self, name: str, compute):
+        # Compute only if not done since the last update, arrays are written to preallocated buffers
+        _entry = self._cache.get(name)
+        if _entry is None or _entry[0] != self._version:
+            _entry = (self._version, compute())
+            self._cache[name] = _entry
+        return _entry[1]
+
+    # Read raw, offset corrected, or scaled data, the returned arrays are overwritten after the next update
     def raw(self) -> np.ndarray:
         return self._data
+    def timestamp_ns(self) -> int:
+        return self._timestamp_ns
     def offcor(self) -> np.ndarray:
-        return self._data + self._offset
+        return self._cached('offcor', lambda: np.add(self._data, self._offset, out=self._offcor))
     def scaled(self) -> np.ndarray:
-        return (self._data + self._offset) * self._scaling
+        return self._cached('scaled', lambda: np.multiply(self.offcor(), self._scaling, out=self._scaled))
     
     # Min/max integer over all elements of current data    
     def minmax_raw(self) -> tuple[int, int]:
-        return np.min(self._data), np.max(self._data)
+        return self._cached('minmax_raw', lambda: (self._min(self._data), self._max(self._data)))
     def minmax_scaled(self) -> tuple[int, int]:
-        return np.min(self.scaled()), np.max(self.scaled())
+        return self._cached('minmax_scaled', lambda: (self._min(self.scaled()), self._max(self.scaled())))
 
     # Forever min/max array of current and previous data
     def max_forever_raw_array(self) -> np.ndarray:
@@ -60,11 +117,15 @@ class Data:
     def min_forever_raw_array(self) -> np.ndarray:
         return self._fmin
     def max_forever_scaled_array(self) -> np.ndarray:
-        return (self._fmax + self._offset) * self._scaling
+        return self._cached('fmax_scaled', lambda: self._offset_scale(self._fmax, self._fmax_scaled))
     def min_forever_scaled_array(self) -> np.ndarray:
-        return (self._fmin + self._offset) * self._scaling
+        return self._cached('fmin_scaled', lambda: self._offset_scale(self._fmin, self._fmin_scaled))
     # Forever min/max integer over all elements of current and previous data
     def minmax_forever_raw(self) -> tuple[int, int]:
-        return np.min(self._fmin), np.max(self._fmax)
+        return self._cached('minmax_forever_raw', lambda: (self._min(self._fmin), self._max(self._fmax)))
     def minmax_forever_scaled(self) -> tuple[int, int]:
-        return np.min(self.min_forever_scaled_array()), np.max(self.max_forever_scaled_array())
+        return self._cached('minmax_forever_scaled', lambda: (self._min(self.min_forever_scaled_array()), self._max(self.max_forever_scaled_array())))
+
+    def _offset_scale(self, array: np.ndarray, out: np.ndarray) -> np.ndarray:
+        np.add(array, self._offset, out=out)
+        return np.multiply(out, self._scaling, out=out)
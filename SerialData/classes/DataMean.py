@@ -18,32 +18,101 @@ import numpy as np
 from threading import Event
 
 from SerialData.classes.Data import Data
+from SerialData.classes.PixelMask import PixelMask
 
 
 class DataMean(Data):
+    """
+    Mean over the incoming frames, updated in place in preallocated buffers without per-frame allocations.
+    Modes:
+        exponential: rolling average, for example for measurement 17: 9/10 old + 1/10 new, the current default
+        boxcar: true mean of the last avg_count frames, running sum over a ring buffer of frames
+        cumulative: mean of all frames since start
+    A boxcar ring of more than max_ring_values values falls back to cumulative, the same mean up to avg_count frames.
+    """
+    modes = ('exponential', 'boxcar', 'cumulative')
+    max_ring_values: int = 2**23 # 64 MB of float64
+
     # _data holds rolling mean
     _counter: int = 0
 
     _avg_count: int = -1
+    _mode: str = 'exponential'
     avg_count_reached_event: Event = None
 
-    def __init__(self, offset: np.ndarray, scaling: np.ndarray, avg_count:int, avg_count_reached_event: Event = None) -> None:
-        super().__init__(offset, scaling) 
+    _delta: np.ndarray = None
+    # Boxcar running sum and ring of the summed frames
+    _sum: np.ndarray = None
+    _ring: np.ndarray = None
+
+    def __init__(self, offset: np.ndarray, scaling: np.ndarray, avg_count:int, avg_count_reached_event: Event = None, mode: str = 'exponential', mask: PixelMask = None) -> None:
+        super().__init__(offset, scaling, mask)
         self._avg_count = avg_count
+        if mode == 'boxcar' and avg_count * offset.size > self.max_ring_values:
+            print("Warning: Boxcar averaging count too large, cumulative mean instead.")
+            mode = 'cumulative'
+        self._mode = mode
         self.avg_count_reached_event = avg_count_reached_event
 
+        self._data = np.zeros(offset.shape)
+        self._delta = np.zeros(offset.shape)
+        if self._mode == 'boxcar':
+            self._sum = np.zeros(offset.shape)
+            self._ring = np.zeros((avg_count,) + offset.shape)
+
     def update(self, data: np.ndarray) -> None:
         self._counter += 1
-        
-        if self._counter == 1:
-            super().update(data)
-        elif self._counter < self._avg_count:
-            # Dirty rolling average start, for example for measurement 5 with index 4: 4/5 old + 1/5 new
-            super().update( (self._counter - 1)/self._counter * self._data + 1/self._counter * data )
+
+        if self._mode == 'boxcar':
+            self._update_boxcar(data)
         else:
-            # Rolling average, for example for measurement 17 with index 16: 9/10 old + 1/10 new
-            super().update( (self._avg_count - 1)/self._avg_count * self._data + 1/self._avg_count * data )
+            # Dirty rolling average start, for example for measurement 5: 4/5 old + 1/5 new
+            _count = self._counter if self._mode == 'cumulative' else min(self._counter, self._avg_count)
+            # Same as (n-1)/n * mean + 1/n * data, in place: mean += (data - mean) / n
+            np.subtract(data, self._data, out=self._delta)
+            np.multiply(self._delta, 1 / _count, out=self._delta)
+            np.add(self._data, self._delta, out=self._data)
+        self._update_forever()
 
         # Targeted averaging count reached, let the world know
         if self._counter == self._avg_count and self.avg_count_reached_event is not None:
             self.avg_count_reached_event.set()
+
+    def _update_boxcar(self, data: np.ndarray) -> None:
+        _slot = (self._counter - 1) % self._avg_count
+        if self._counter > self._avg_count:
+            if _slot == 0:
+                # Once per round sum up again, running sums accumulate rounding errors
+                np.sum(self._ring, axis=0, out=self._sum)
+            np.subtract(self._sum, self._ring[_slot], out=self._sum)
+        np.copyto(self._ring[_slot], data)
+        np.add(self._sum, self._ring[_slot], out=self._sum)
+        np.multiply(self._sum, 1 / min(self._counter, self._avg_count), out=self._data)
+
+    def update_batch(self, data: np.ndarray) -> None:
+        """
+        Several frames at once, first axis is the frame index. Gives the same mean as single updates but the forever
+        min/max only sees the mean after the batch.
+        """
+        # Boxcar is cheap enough frame by frame
+        if self._mode == 'boxcar':
+            for _data in data:
+                self.update(_data)
+            return
+
+        # Each single update is mean = a * mean + b * data with b = 1/k, a = 1 - b, and k = min(counter, avg_count)
+        _counters = np.arange(self._counter + 1, self._counter + len(data) + 1)
+        _b = 1 / (_counters if self._mode == 'cumulative' else np.minimum(_counters, self._avg_count))
+        _a = 1 - _b
+        # Weight of each frame in the final mean is its b times the a of all later frames
+        _a_later = np.append(np.cumprod(_a[:0:-1])[::-1], 1)
+        np.multiply(self._data, np.prod(_a), out=self._data)
+        self._data += np.tensordot(_b * _a_later, data, axes=1)
+
+        _counter_before = self._counter
+        self._counter += len(data)
+        self._update_forever()
+
+        # Targeted averaging count reached within this batch, let the world know
+        if _counter_before < self._avg_count <= self._counter and self.avg_count_reached_event is not None:
+            self.avg_count_reached_event.set()
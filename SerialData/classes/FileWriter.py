@@ -0,0 +1,166 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import queue
+import time
+from threading import Thread, Lock
+
+
+class FileWriter:
+    """
+    Runs file writes in a background thread, a slow disk or network share never delays the calling thread.
+    Writes are queued as jobs up to max_queue. When the queue is full, frame payloads submitted as droppable either
+    block the caller or are dropped, depending on the policy. All other jobs, e.g. opening files and writing headers
+    or indexes, always wait for room, dropping one would corrupt the file.
+    The thread drains all waiting jobs in one go, jobs run in the order they were submitted. After close, jobs run
+    directly in the calling thread, nothing is left running that would keep the interpreter alive.
+    Arguments are used as they are when the job runs, arrays that are re-used need to be copied before submitting.
+    """
+
+    policies = ('block', 'drop')
+
+    _queue: queue.Queue = None
+    _policy: str = 'block'
+    _thread: Thread = None
+    _lock: Lock = None
+    __stopped: bool = False
+    _closed: bool = False
+
+    # Counters and write latency from submit to completion
+    _submitted: int = 0
+    _written: int = 0
+    _dropped: int = 0
+    _failed: int = 0
+    _queue_max: int = 0
+    _latency_sum_ns: int = 0
+    _latency_max_ns: int = 0
+    _latency_last_ns: int = 0
+
+
+    def __init__(self, max_queue: int = 256, policy: str = 'block') -> None:
+        self._queue = queue.Queue(max_queue)
+        self._lock = Lock()
+        self.set_policy(policy)
+
+    def set_policy(self, policy: str) -> None:
+        # Block the caller until there is room, or drop the write
+        if policy not in self.policies:
+            print("Warning: Unknown write policy.")
+            return
+        self._policy = policy
+
+    def submit(self, function, *args, **kwargs) -> None:
+        """
+        Queue function(*args, **kwargs), never dropped, blocks while the queue is full.
+        """
+        self._submit(function, args, kwargs, False)
+
+    def submit_droppable(self, function, *args, **kwargs) -> bool:
+        """
+        Queue a frame payload write, function(*args, **kwargs), returns False if it was dropped by the drop policy.
+        """
+        return self._submit(function, args, kwargs, self._policy == 'drop')
+
+    def _submit(self, function, args: tuple, kwargs: dict, droppable: bool) -> bool:
+        with self._lock:
+            if self._closed:
+                self._submitted += 1
+                self._run(time.monotonic_ns(), function, args, kwargs)
+                return True
+            # Thread is started with the first job
+            if self._thread is None:
+                self.__stopped = False
+                self._thread = Thread(target=self._writer_thread)
+                self._thread.start()
+            self._submitted += 1
+
+        try:
+            self._queue.put((time.monotonic_ns(), function, args, kwargs), block=not droppable)
+        except queue.Full:
+            self._dropped += 1
+            return False
+        self._queue_max = max(self._queue_max, self._queue.qsize())
+        return True
+
+    def flush(self) -> None:
+        # Wait until all submitted jobs are done
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        # Finish all jobs and stop the thread
+        with self._lock:
+            self._closed = True
+            if self._thread is None:
+                return
+            self._queue.join()
+            self.__stopped = True
+            self._thread.join()
+            self._thread = None
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        """
+        Queue depth now and at most, job counts, and mean, max and last write latency in milliseconds.
+        """
+        _done = self._written + self._failed
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_max': self._queue_max,
+            'submitted': self._submitted,
+            'written': self._written,
+            'dropped': self._dropped,
+            'failed': self._failed,
+            'latency_mean_ms': self._latency_sum_ns / _done / 1e6 if _done > 0 else None,
+            'latency_max_ms': self._latency_max_ns / 1e6,
+            'latency_last_ms': self._latency_last_ns / 1e6,
+        }
+
+    def _writer_thread(self) -> None:
+        while True:
+            # Check for stop flag, short timeout for a quick shutdown
+            if self.__stopped is True:
+                break
+
+            try:
+                _jobs = [self._queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            # Drain everything else waiting
+            try:
+                while True:
+                    _jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            for _job in _jobs:
+                self._run(*_job)
+                self._queue.task_done()
+
+    def _run(self, submit_ns: int, function, args: tuple, kwargs: dict) -> None:
+        try:
+            function(*args, **kwargs)
+            self._written += 1
+        except Exception as e:
+            self._failed += 1
+            print(f"Warning: File write failed: {e}")
+
+        _latency = time.monotonic_ns() - submit_ns
+        self._latency_sum_ns += _latency
+        self._latency_max_ns = max(self._latency_max_ns, _latency)
+        self._latency_last_ns = _latency
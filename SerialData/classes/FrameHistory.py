@@ -0,0 +1,107 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+import numpy as np
+import time
+
+
+class FrameHistory:
+    """
+    Ring buffer of the last frames with raw, offset corrected and scaled data, timestamp and sequence number.
+    All buffers are preallocated, reading the last n frames returns views without copying: one segment if they are
+    contiguous in the ring, otherwise two segments, oldest first.
+    Frames are written from the serial thread, the oldest read segment may be overwritten while it is used.
+    """
+
+    _depth: int = 0
+    _count: int = 0 # Frames written in total, also the next sequence number
+
+    _offset: np.ndarray = None
+    _scaling: np.ndarray = None
+
+    _raw: np.ndarray = None
+    _offcor: np.ndarray = None
+    _scaled: np.ndarray = None
+    _timestamps: np.ndarray = None
+    _sequence: np.ndarray = None
+
+
+    def __init__(self, depth: int, offset: np.ndarray, scaling: np.ndarray) -> None:
+        self._depth = depth
+        self._offset = offset
+        self._scaling = scaling
+
+        _shape = (depth,) + offset.shape
+        self._raw = np.zeros(_shape)
+        self._offcor = np.zeros(_shape)
+        self._scaled = np.zeros(_shape)
+        self._timestamps = np.zeros(depth, dtype=np.int64)
+        self._sequence = np.zeros(depth, dtype=np.int64)
+
+    def append(self, data: np.ndarray, timestamp_ns: int = None) -> None:
+        _index = self._count % self._depth
+        np.copyto(self._raw[_index], data)
+        np.add(data, self._offset, out=self._offcor[_index])
+        np.multiply(self._offcor[_index], self._scaling, out=self._scaled[_index])
+        self._timestamps[_index] = time.monotonic_ns() if timestamp_ns is None else timestamp_ns
+        self._sequence[_index] = self._count
+        self._count += 1
+
+    def append_batch(self, data: np.ndarray, timestamp_ns: int = None) -> None:
+        # Several frames at once, first axis is the frame index, only the last depth frames are kept
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        _skipped = max(len(data) - self._depth, 0)
+        self._count += _skipped
+        data = data[_skipped:]
+
+        for _ring, _batch in self._slices(self._count, len(data)):
+            np.copyto(self._raw[_ring], data[_batch])
+            np.add(data[_batch], self._offset, out=self._offcor[_ring])
+            np.multiply(self._offcor[_ring], self._scaling, out=self._scaled[_ring])
+            self._timestamps[_ring] = timestamp_ns
+            self._sequence[_ring] = np.arange(self._count + _batch.start, self._count + _batch.stop)
+
+        self._count += len(data)
+
+    def __len__(self) -> int:
+        return min(self._count, self._depth)
+
+    # Read raw, offset corrected, or scaled data of the last n frames, all if not given
+    def raw(self, n: int = None) -> tuple[np.ndarray, ...]:
+        return self._segments(self._raw, n)
+    def offcor(self, n: int = None) -> tuple[np.ndarray, ...]:
+        return self._segments(self._offcor, n)
+    def scaled(self, n: int = None) -> tuple[np.ndarray, ...]:
+        return self._segments(self._scaled, n)
+    # Matching timestamps in ns of time.monotonic_ns() and sequence numbers
+    def timestamps(self, n: int = None) -> tuple[np.ndarray, ...]:
+        return self._segments(self._timestamps, n)
+    def sequence(self, n: int = None) -> tuple[np.ndarray, ...]:
+        return self._segments(self._sequence, n)
+
+    def _segments(self, array: np.ndarray, n: int) -> tuple[np.ndarray, ...]:
+        n = len(self) if n is None else min(n, len(self))
+        return tuple(array[_ring] for _ring, _ in self._slices(self._count - n, n))
+
+    def _slices(self, start: int, n: int) -> list[tuple[slice, slice]]:
+        # Ring slices for n frames starting at total count start, with matching slice of the n frames, wraps at most once
+        _start = start % self._depth
+        _first = min(n, self._depth - _start)
+        _slices = [(slice(_start, _start + _first), slice(0, _first))]
+        if _first < n:
+            _slices.append((slice(0, n - _first), slice(_first, n)))
+        return _slices
@@ -0,0 +1,172 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+import numpy as np
+import re
+
+
+# Precompiled patterns, see _serial_thread for the line format
+#   0:07:42 [D] -13,-124,333;-13,-124,333;
+_ansi_pattern = re.compile(r'\x1b\[[\d;]*\d+m')
+# _ansi_pattern = re.compile(r'\x1b\[([0-9,A-Z]{1,2}(;[0-9]{1,2})?(;[0-9]{3})?)?[m|K]?')
+_csv_pattern = re.compile(r"(?:[-?\d+{,|;}]*-?\d+;)")
+# Below this many values np.fromstring is faster, above it the C parser of np.loadtxt
+_loadtxt_min_values = 256
+
+
+class FrameParser:
+    """
+    Parses CSV lines such as 'a,b,c;d,e,f;' into a 2D numpy array.
+    The frame shape is cached after the first frame, any following frame of the same shape is decoded in bulk
+    straight into a preallocated buffer. The generic row-by-row path is only used again when the shape changes.
+    The returned buffer is re-used for the next frame, copy it if it needs to be kept.
+    """
+
+    _shape: tuple = None
+    _size: int = 0
+
+    _buffer: np.ndarray = None
+
+
+    def parse(self, line: str) -> np.ndarray:
+        # Strip any ANSI codes, skip the regex for the common case without any
+        if '\x1b' in line:
+            line = _ansi_pattern.sub('', line)
+
+        # Shape is known, try bulk decoding first
+        if self._shape is not None:
+            _payload = self._split_payload(line)
+            if _payload is not None:
+                _values = self._decode(_payload)
+                if _values is not None:
+                    np.copyto(self._buffer, _values[0])
+                    return self._buffer
+
+        # Ignore messages not matching expected CSV content
+        _newData = _csv_pattern.search(line)
+        if _newData is None:
+            return None
+        return self._parse_generic(_newData[0])
+
+    def parse_batch(self, lines: list[str]) -> np.ndarray:
+        """
+        Parse several lines at once, returns an array with the frame index as first axis.
+        Frames of the cached shape are decoded in a single call, a shape change discards the frames before it.
+        """
+        _payloads = []
+        for _line in lines:
+            _line = _line.strip()
+            if '\x1b' in _line:
+                _line = _ansi_pattern.sub('', _line)
+
+            if self._shape is not None:
+                _payload = self._split_payload(_line)
+                if _payload is not None:
+                    _payloads.append(_payload)
+                    continue
+
+            # Unknown shape or other message, parse on its own
+            _newData = _csv_pattern.search(_line)
+            if _newData is None:
+                continue
+            _shape = self._shape
+            if self._parse_generic(_newData[0]) is None:
+                continue
+            if self._shape != _shape:
+                _payloads = []
+            _payloads.append(_newData[0])
+
+        if len(_payloads) == 0:
+            return None
+
+        _frames = self._decode(''.join(_payloads), len(_payloads))
+        if _frames is not None:
+            return _frames
+
+        # Some frame does not fit, decode one by one, others are parsed on their own as in parse(), e.g. with a prefix
+        # not separated by a space or a changed shape, which is then cached
+        _frames = []
+        for _payload in _payloads:
+            _values = self._decode(_payload)
+            if _values is None:
+                _newData = _csv_pattern.search(_payload)
+                if _newData is None:
+                    continue
+                _shape = self._shape
+                _data = self._parse_generic(_newData[0])
+                if _data is None:
+                    continue
+                if self._shape != _shape:
+                    _frames = []
+                # The buffer is re-used for the next frame
+                _values = _data[None].copy()
+            _frames.append(_values)
+        if len(_frames) == 0:
+            return None
+        return np.concatenate(_frames)
+
+    def reset(self) -> None:
+        self._shape = None
+        self._size = 0
+        self._buffer = None
+
+    def _split_payload(self, line: str) -> str:
+        # CSV payload is at the end of the line, anything before is prefix separated by a space, there may be none
+        line = line.strip()
+        _space = line.rfind(' ')
+        _payload = line if _space == -1 else line[_space + 1:]
+        # Cheap check the payload fits the cached shape, rows and the columns of the first row
+        if not _payload.endswith(';') or _payload.count(';') != self._shape[0]:
+            return None
+        if _payload.count(',', 0, _payload.find(';')) != self._shape[1] - 1:
+            return None
+        return _payload
+
+    def _decode(self, payload: str, frame_count: int = 1) -> np.ndarray:
+        # Rows of all frames, drop the empty one after the trailing delimiter
+        _rows = payload.split(';')[:-1]
+        if len(_rows) != frame_count * self._shape[0]:
+            return None
+
+        try:
+            if frame_count * self._size < _loadtxt_min_values:
+                # Same number of values in each row, otherwise frames are misaligned
+                if not all(_row.count(',') == self._shape[1] - 1 for _row in _rows):
+                    return None
+                _values = np.fromstring(','.join(_rows), sep=',')
+            else:
+                # Rejects rows of different length by itself
+                _values = np.loadtxt(_rows, delimiter=',', ndmin=2)
+        except ValueError:
+            return None
+
+        # Partially read or differently sized rows, let the generic path sort it out
+        if _values.size != frame_count * self._size:
+            return None
+        return _values.reshape((frame_count,) + self._shape)
+
+    def _parse_generic(self, payload: str) -> np.ndarray:
+        try:
+            _data = np.array([list(map(float, row.split(','))) for row in payload.split(';') if row])
+        except:
+            print("Data not numpy array.") # This should never happen
+            return None
+
+        # Cache the new shape and buffer for bulk decoding of the next frames
+        self._shape = _data.shape
+        self._size = _data.size
+        self._buffer = _data
+        return self._buffer
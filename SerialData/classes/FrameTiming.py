@@ -0,0 +1,148 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+from bisect import bisect_right
+
+
+# Histogram bin edges of the frame interval in ns, 20 logarithmic bins per decade from 1 us to 100 s
+_edges_ns = [round(10**(_exponent / 20)) for _exponent in range(60, 221)]
+# Gap longer than this many periods counts as dropped frames
+_drop_threshold = 1.5
+# Sequence numbers of the device are uint32
+_sequence_range = 2**32
+
+
+class FrameTiming:
+    """
+    Inter-frame interval statistics of time.monotonic_ns() arrival timestamps, cheap enough to be always on.
+    Intervals go into a fixed logarithmic histogram, percentiles are read from it with a resolution of about 12 %.
+    Frames decoded from the same chunk share its arrival time, the gap to the previous chunk is divided evenly over them.
+    Dropped frames are counted from device sequence numbers if available, otherwise from gaps longer than 1.5 periods.
+    The period is estimated from the median interval unless set.
+    """
+
+    frames: int = 0
+    dropped: int = 0
+    max_gap_ns: int = 0
+
+    _histogram: list = None
+    _intervals: int = 0
+    _sum_ns: int = 0
+    _last_ns: int = None
+    _last_sequence: int = None
+
+    _period_ns: int = None # Set from outside, not reset
+    _estimated_period_ns: int = None
+    _next_estimate: int = 16 # Interval count of the next period estimate
+
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def update(self, timestamp_ns: int, frame_count: int = 1, sequence: int = None, sequenced_count: int = None) -> None:
+        """
+        Arrival of frame_count frames, sequence is the device sequence number of the last one if available.
+        sequenced_count is the number of these frames counted by the device sequence, all by default, e.g. binary
+        frames decoded together with CSV lines.
+        """
+        if frame_count <= 0:
+            return
+        self.frames += frame_count
+
+        if self._last_ns is not None:
+            _gap = timestamp_ns - self._last_ns
+            self._histogram[bisect_right(_edges_ns, _gap // frame_count)] += frame_count
+            self._intervals += frame_count
+            self._sum_ns += _gap
+            if _gap > self.max_gap_ns:
+                self.max_gap_ns = _gap
+
+            if sequence is None:
+                _period = self.period_ns()
+                if _period is not None and _gap > (frame_count - 1 + _drop_threshold) * _period:
+                    self.dropped += max(round(_gap / _period) - frame_count, 0)
+
+        if sequence is not None:
+            if self._last_sequence is not None:
+                # Wraps at the uint32 limit, a jump backwards is a restarted device and no loss
+                _missing = (sequence - self._last_sequence - (frame_count if sequenced_count is None else sequenced_count)) % _sequence_range
+                if _missing < _sequence_range // 2:
+                    self.dropped += _missing
+            self._last_sequence = sequence
+
+        self._last_ns = timestamp_ns
+
+    def reset(self) -> None:
+        self.frames = 0
+        self.dropped = 0
+        self.max_gap_ns = 0
+        self._histogram = [0] * (len(_edges_ns) + 1)
+        self._intervals = 0
+        self._sum_ns = 0
+        self._last_ns = None
+        self._last_sequence = None
+        self._estimated_period_ns = None
+        self._next_estimate = 16
+
+    def set_expected_period(self, period_ms: float) -> None:
+        # Known frame period of the device, None to estimate it from the median interval
+        self._period_ns = None if period_ms is None else round(period_ms * 1e6)
+
+    def period_ns(self) -> int:
+        if self._period_ns is not None:
+            return self._period_ns
+        # Re-estimate at growing intervals, at least every 1024 frames
+        if self._intervals >= self._next_estimate:
+            self._estimated_period_ns = self.percentile_ns(50)
+            self._next_estimate = self._intervals + min(self._intervals, 1024)
+        return self._estimated_period_ns
+
+    def percentile_ns(self, percent: float) -> int:
+        # Geometric center of the histogram bin holding the percentile
+        if self._intervals == 0:
+            return None
+        _target = self._intervals * percent / 100
+        _cumulative = 0
+        for _bin, _count in enumerate(self._histogram):
+            _cumulative += _count
+            if _cumulative >= _target and _count > 0:
+                break
+        if _bin == 0:
+            return _edges_ns[0]
+        if _bin == len(_edges_ns):
+            return _edges_ns[-1]
+        return round(np.sqrt(_edges_ns[_bin - 1] * _edges_ns[_bin]))
+
+    def stats(self) -> dict:
+        """
+        Frames, dropped frames, median, 99th percentile and mean interval, longest gap and period in milliseconds.
+        """
+        _ms = lambda _ns: None if _ns is None else _ns / 1e6
+        return {
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'p50_ms': _ms(self.percentile_ns(50)),
+            'p99_ms': _ms(self.percentile_ns(99)),
+            'mean_ms': _ms(self._sum_ns / self._intervals if self._intervals > 0 else None),
+            'max_gap_ms': _ms(self.max_gap_ns),
+            'period_ms': _ms(self.period_ns()),
+        }
+
+    def histogram(self) -> tuple[np.ndarray, np.ndarray]:
+        # Bin edges in ms and counts, first and last bin are open towards zero and infinity
+        _edges_ms = np.concatenate(([0.], np.array(_edges_ns) / 1e6, [np.inf]))
+        return _edges_ms, np.array(self._histogram)
@@ -0,0 +1,211 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+import time
+
+from SerialData.SerialData import SerialData
+from SerialData.classes.Subscription import Subscription
+
+
+class LivePlot:
+    """
+    Live time series of every element, each on its own y-axis, over a sliding time window.
+    Frames come from the history ring buffer of SerialData, memory is fixed by its depth.
+    The window is decimated to a minimum and maximum per pixel column of the axes, so peaks stay visible. Buckets of
+    the column width in time are updated with the new frames only, the cost of a redraw depends on the plot width and
+    the frames since the last one, not on the history depth. Axis limits are updated at a lower rate.
+    """
+
+    serialData: SerialData = None
+    fig: plt.Figure = None
+    axes: list = None
+    lines: list = None
+
+    _data: str = 'scaled' # History data to plot, raw, offcor or scaled
+    _window_ns: int = 0
+    _interval_ms: int = 100
+    _autoscale_interval_ns: int = 0
+
+    _subscription: Subscription = None
+    _buckets: '_MinMaxBuckets' = None
+    _timer = None
+    _last_autoscale_ns: int = 0
+
+
+    def __init__(self, serialData: SerialData, data: str = 'scaled', window_s: float = 10., interval_ms: int = 100, autoscale_interval_s: float = 1.) -> None:
+        """
+        History needs to be set and deep enough for the window, e.g. set_history(window_s * frame rate).
+        """
+        if serialData._history_depth == 0:
+            print("Warning: History is not set, nothing to plot.")
+        self.serialData = serialData
+        self._subscription = serialData.subscribe('keep_latest')
+        self._data = data
+        self._window_ns = int(window_s * 1e9)
+        self._interval_ms = interval_ms
+        self._autoscale_interval_ns = int(autoscale_interval_s * 1e9)
+
+        self.fig, _ax = plt.subplots(figsize=(4*3, 4*2))
+        self.fig.canvas.mpl_connect('close_event', self._on_close) # Exit thread with plot close
+
+        self.axes = [_ax]
+        for i in range(serialData.size - 1):
+            # Twin the x-axis for independent y-axes
+            self.axes.append(_ax.twinx())
+            # Move the last y-axis spine over to the right by 10% of the width of the axes
+            self.axes[-1].spines['right'].set_position(('axes', 1 + i * 0.1))
+        # Space on the right side for the extra y-axis
+        self.fig.subplots_adjust(left=0.065, right=(1 - (serialData.size - 1) * 0.065))
+
+        # Seconds before the latest frame
+        _ax.set_xlabel('Time (s)')
+        _ax.set_xlim(-window_s, 0)
+
+        self.lines = []
+        for i, ax in enumerate(self.axes):
+            # Std matplotlib color palette
+            _color = plt.rcParams['axes.prop_cycle'].by_key()['color'][i % 10]
+            # Plot line, returns a list of lines where we only need the first
+            self.lines.append( ax.plot([], [], label=f"{i+1}", color=_color, linewidth=0.5)[0] )
+            # Color axis with plot
+            ax.tick_params(axis='y', colors=_color)
+
+        # Add legend to first axis
+        _ax.legend(self.lines, [_line.get_label() for _line in self.lines], loc='upper center', bbox_to_anchor=(0.5, 1.1), fontsize= 'small', ncol=serialData.size)
+
+    def show(self) -> None:
+        # Blocks until the figure is closed
+        self._timer = self.fig.canvas.new_timer(interval=self._interval_ms)
+        self._timer.add_callback(self.update)
+        self._timer.start()
+        plt.show()
+
+    def update(self) -> bool:
+        """
+        Updates the lines if there is a new frame, returns False if there was none.
+        """
+        # Latest frame only, nothing queues up
+        if self._subscription.get(timeout=0) is None:
+            return False
+        _history = self.serialData.history
+        if _history is None or len(_history) == 0:
+            return False
+
+        # Rebuilt from the history on restart or resize, else updated with the new frames only
+        _columns = max(int(self.axes[0].bbox.width), 1)
+        if self._buckets is None or self._buckets.history is not _history or self._buckets.columns != _columns:
+            self._buckets = _MinMaxBuckets(_history, self._data, self._window_ns, _columns)
+        self._buckets.update()
+
+        # Two points per pixel column
+        _x, _y = self._buckets.points()
+        if len(_x) == 0:
+            return False
+        for i, _line in enumerate(self.lines):
+            _line.set_data(_x, _y[:, i])
+
+        _now = time.monotonic_ns()
+        if _now - self._last_autoscale_ns > self._autoscale_interval_ns:
+            self._last_autoscale_ns = _now
+            for i, ax in enumerate(self.axes):
+                # Masked elements may be NaN
+                _min, _max = np.nanmin(_y[:, i]), np.nanmax(_y[:, i])
+                if not np.isfinite(_min) or not np.isfinite(_max):
+                    continue
+                _margin = 0.05 * (_max - _min) if _max > _min else 0.05 * abs(_max) + 1e-9
+                ax.set_ylim(_min - _margin, _max + _margin)
+
+        self.fig.canvas.draw_idle()
+        return True
+
+    def _on_close(self, _) -> None:
+        if self._timer is not None:
+            self._timer.stop()
+        self.serialData.unsubscribe(self._subscription)
+        self.serialData.stop_serial()
+
+
+class _MinMaxBuckets:
+    """
+    Minimum and maximum per element in buckets of window / columns in time, a ring of one bucket per column.
+    """
+
+    history = None
+    columns: int = 0
+
+    _data: str = 'scaled'
+    _bucket_ns: int = 1
+    _next: int = 0 # Sequence number of the next frame to add
+    _latest_ns: int = 0
+    _ids: np.ndarray = None # Bucket of each slot, timestamp // bucket width, -1 if empty
+    _min: np.ndarray = None
+    _max: np.ndarray = None
+
+
+    def __init__(self, history, data: str, window_ns: int, columns: int) -> None:
+        self.history = history
+        self.columns = columns
+        self._data = data
+        self._bucket_ns = max(window_ns // columns, 1)
+        # One more than columns, the latest bucket is still filling
+        self._ids = np.full(columns + 1, -1, dtype=np.int64)
+
+    def update(self) -> None:
+        _last = int(self.history.sequence(1)[-1][-1])
+        _count = _last + 1 - self._next
+        if _count <= 0:
+            return
+        # Each ring segment on its own, no copy of the window
+        for _timestamps, _values in zip(self.history.timestamps(_count), getattr(self.history, self._data)(_count)):
+            self._add(_timestamps, _values.reshape(len(_values), -1))
+        self._next = _last + 1
+        self._latest_ns = int(self.history.timestamps(1)[-1][-1])
+
+    def _add(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        # Frames are in time order, each run of the same bucket is reduced at once
+        _ids = timestamps // self._bucket_ns
+        _starts = np.flatnonzero(np.diff(_ids, prepend=_ids[0] - 1))
+        _ids = _ids[_starts]
+        _min = np.minimum.reduceat(values, _starts, axis=0)
+        _max = np.maximum.reduceat(values, _starts, axis=0)
+        # Only the latest buckets fit the ring, slots are then unique
+        _keep = slice(max(len(_ids) - len(self._ids), 0), None)
+        _ids, _min, _max = _ids[_keep], _min[_keep], _max[_keep]
+
+        if self._min is None:
+            self._min = np.zeros((len(self._ids), values.shape[1]))
+            self._max = np.zeros((len(self._ids), values.shape[1]))
+        _slots = _ids % len(self._ids)
+        # Merged into a bucket already in the slot, else the slot starts over
+        _same = (self._ids[_slots] == _ids)[:, None]
+        self._min[_slots] = np.where(_same, np.minimum(self._min[_slots], _min), _min)
+        self._max[_slots] = np.where(_same, np.maximum(self._max[_slots], _max), _max)
+        self._ids[_slots] = _ids
+
+    def points(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Seconds before the latest frame and values, minimum and maximum of each bucket in the window, oldest first.
+        """
+        if self._min is None:
+            return np.zeros(0), np.zeros((0, 0))
+        _latest = self._latest_ns // self._bucket_ns
+        _order = np.argsort(self._ids)
+        _order = _order[self._ids[_order] > _latest - self.columns]
+        _x = np.repeat((self._ids[_order] * self._bucket_ns - self._latest_ns) / 1e9, 2)
+        _y = np.stack((self._min[_order], self._max[_order]), axis=1).reshape(2 * len(_order), -1)
+        return _x, _y
@@ -0,0 +1,149 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import matplotlib.pyplot as plt
+import time
+
+from SerialData.SerialData import SerialData
+from SerialData.classes.Subscription import Subscription
+
+
+class LiveView:
+    """
+    Live view of a 2D matrix with blitting: per frame only the image is redrawn onto a saved background.
+    Colorbar limits, axes and the fps in the title are updated at a separate, lower rate with a full redraw.
+    A GUI timer polls for a new frame, without one nothing is rendered. Only the latest frame is drawn, frames arriving
+    in between are skipped and never queue up, the GUI can not fall behind the acquisition.
+    """
+
+    serialData: SerialData = None
+    fig: plt.Figure = None
+    ax: plt.Axes = None
+    im = None
+
+    _array = None # Callable returning the frame to show
+    _minmax = None # Callable returning the colorbar limits
+    _interval_ms: int = 50
+    _clim_interval_ns: int = 0
+
+    _subscription: Subscription = None
+    _timer = None
+    _background = None
+    _last_clim_ns: int = 0
+
+    # Rendered and acquired frames since the last fps update
+    _rendered: int = 0
+    _acquired_start: int = 0
+    _fps_start_ns: int = 0
+    rendered_fps: float = 0.
+    acquired_fps: float = 0.
+
+
+    def __init__(self, serialData: SerialData, array = None, minmax = None, interval_ms: int = 50, clim_interval_s: float = 1.) -> None:
+        """
+        Array and minmax are callables, scaled data and its forever min/max by default:
+            array = lambda: serialData.mean.raw()
+            minmax = lambda: serialData.data.minmax_scaled()
+        Interval is the polling period of the GUI timer, the colorbar is updated every clim_interval_s.
+        """
+        self.serialData = serialData
+        self._subscription = serialData.subscribe('keep_latest')
+        self._array = (lambda: serialData.data.scaled()) if array is None else array
+        self._minmax = (lambda: serialData.data.minmax_forever_scaled()) if minmax is None else minmax
+        self._interval_ms = interval_ms
+        self._clim_interval_ns = int(clim_interval_s * 1e9)
+
+        self.fig, self.ax = plt.subplots()
+        self.fig.canvas.mpl_connect('close_event', self._on_close) # Exit thread with plot close
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        # Animated artists are left out of full redraws, they are drawn onto the background
+        self.im = self.ax.imshow(self._array(), aspect = 'auto', origin='upper', cmap='viridis', animated=True,
+                                 extent=(0.5, serialData.sizeX() + 0.5, serialData.sizeY() + 0.5, 0.5))
+        self.im.set_clim(self._minmax())
+        # Show only the major ticks
+        self.ax.xaxis.set_major_locator(plt.MaxNLocator(integer=True))
+        self.ax.yaxis.set_major_locator(plt.MaxNLocator(integer=True))
+        # Colorbar
+        plt.colorbar(self.im, ax=self.ax, orientation="vertical")
+
+    def show(self) -> None:
+        # Blocks until the figure is closed
+        self._timer = self.fig.canvas.new_timer(interval=self._interval_ms)
+        self._timer.add_callback(self.update)
+        self._timer.start()
+        self._fps_start_ns = time.monotonic_ns()
+        self._acquired_start = self.serialData.timing.frames
+        plt.show()
+
+    def update(self) -> bool:
+        """
+        Renders the latest frame if there is a new one, returns False if there was none.
+        """
+        # Latest frame only, nothing queues up
+        if self._subscription.get(timeout=0) is None:
+            return False
+        self.im.set_array(self._array())
+        self._rendered += 1
+
+        _now = time.monotonic_ns()
+        if _now - self._last_clim_ns > self._clim_interval_ns:
+            self._last_clim_ns = _now
+            self.im.set_clim(self._minmax())
+            self._update_fps(_now)
+            # Full redraw, the image is drawn again with the new background
+            self.fig.canvas.draw_idle()
+        elif self._background is None or not self.fig.canvas.supports_blit:
+            self.fig.canvas.draw_idle()
+        else:
+            self.fig.canvas.restore_region(self._background)
+            self.ax.draw_artist(self.im)
+            self.fig.canvas.blit(self.ax.bbox)
+        return True
+
+    def stats(self) -> dict:
+        # Frames per second rendered and acquired, measured over the last colorbar interval
+        return {
+            'rendered_fps': self.rendered_fps,
+            'acquired_fps': self.acquired_fps,
+        }
+
+    def _update_fps(self, now_ns: int) -> None:
+        _elapsed = (now_ns - self._fps_start_ns) / 1e9
+        if _elapsed <= 0:
+            return
+        # Frame counter restarts with the data acquisition
+        _acquired = self.serialData.timing.frames - self._acquired_start
+        if _acquired < 0:
+            _acquired = self.serialData.timing.frames
+        self.rendered_fps = self._rendered / _elapsed
+        self.acquired_fps = _acquired / _elapsed
+        self.ax.set_title(f"{self.rendered_fps:.1f} fps rendered, {self.acquired_fps:.1f} fps acquired", fontsize='small')
+
+        self._rendered = 0
+        self._acquired_start = self.serialData.timing.frames
+        self._fps_start_ns = now_ns
+
+    def _on_draw(self, _) -> None:
+        # Save the background without the image after each full redraw, then draw the image onto it
+        if self.fig.canvas.supports_blit:
+            self._background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.im)
+
+    def _on_close(self, _) -> None:
+        if self._timer is not None:
+            self._timer.stop()
+        self.serialData.unsubscribe(self._subscription)
+        self.serialData.stop_serial()
@@ -20,67 +20,136 @@ from threading import Event
 
 
 class Noise():
-    
+    """
+    Per-pixel noise statistics, updated online with Welford's algorithm, vectorized over all pixels at constant memory.
+    Mean, variance, standard deviation and uncertainty are available live during the measurement.
+    Data, mean and uncertainty of every history_step-th frame are kept for plotting, zero keeps none.
+    """
+
+    # Live statistics, flat per pixel
+    count: int = 0
+    mean: np.ndarray = None
+    _m2: np.ndarray = None # Sum of squared deviations from the mean
+    _delta: np.ndarray = None
+    _delta_new: np.ndarray = None
+
+    # History of every history_step-th frame
     data_historic: np.ndarray = None
     mean_historic: np.ndarray = None
-
     uncertainty: np.ndarray = None
+    x: np.ndarray = None # Count of each history row
+    _history_step: int = 1
 
-    timings: np.ndarray = None
-    _timing_start: int = 0
+    timings: np.ndarray = None # Interval to the previous frame in ms, first is zero
+    _last_ns: int = 0
     
-    _counter: int = 0
     _noise_count: int = 0 # Measurements to stop after
-    x: np.ndarray = None
 
     noise_calculated_event: Event = None
 
 
-    def __init__(self, noise_count:int, noise_calculated_event: Event = None) -> None:
+    def __init__(self, noise_count:int, noise_calculated_event: Event = None, history_step: int = 1) -> None:
         self._noise_count = noise_count
         self.noise_calculated_event = noise_calculated_event
+        self._history_step = history_step
 
-        self.x = np.arange(1, self._noise_count + 1)
+        self.x = np.arange(history_step, self._noise_count + 1, history_step) if history_step > 0 else np.arange(0)
         self.timings = np.zeros(self._noise_count)
 
 
-    def update(self, data: np.ndarray, mean: np.ndarray) -> None:
-        self._counter += 1
-
+    def update(self, data: np.ndarray, mean: np.ndarray, timestamp_ns: int = None) -> None:
         # Do nothing once count is reached
-        if self._counter > self._noise_count:
+        if self.count >= self._noise_count:
             return
-        
-        # Init numpy arrays holding the data, plotting is simpler not having lists
-        if self._counter == 1:
-            self.data_historic = np.zeros((self._noise_count, data.size))
-            self.mean_historic = np.zeros((self._noise_count, data.size))
-            self.uncertainty = np.zeros((self._noise_count, data.size))
-        
-        _index = self._counter -1
-        # Store data
-        self.data_historic[_index] = data.flatten()
-        self.mean_historic[_index] = mean.flatten()
-        # Store timing
-        self.timings[_index] = self._time_difference_ms()
+        self.count += 1
+
+        _data = data.reshape(-1)
+        if self.count == 1:
+            self._init_arrays(_data.size)
 
-        # Finished, calculate noise
-        if self._counter == self._noise_count:
-            self._calculate_uncertainty()
+        # Welford: mean += (data - mean) / n, M2 += (data - old mean) * (data - new mean)
+        np.subtract(_data, self.mean, out=self._delta)
+        np.multiply(self._delta, 1 / self.count, out=self._delta_new)
+        np.add(self.mean, self._delta_new, out=self.mean)
+        np.subtract(_data, self.mean, out=self._delta_new)
+        np.multiply(self._delta, self._delta_new, out=self._delta)
+        np.add(self._m2, self._delta, out=self._m2)
+
+        # Store timing
+        self.timings[self.count - 1] = self._interval_ms(timestamp_ns, 1)
+
+        # Store history
+        if self._history_step > 0 and self.count % self._history_step == 0:
+            _index = self.count // self._history_step - 1
+            self.data_historic[_index] = _data
+            self.mean_historic[_index] = mean.reshape(-1)
+            self.uncertainty[_index] = self.standard_uncertainty()
+
+        self._check_finished()
+
+    def update_batch(self, data: np.ndarray, timestamp_ns: int = None) -> None:
+        """
+        Several frames at once, first axis is the frame index. Merged with Chan's parallel algorithm, no history.
+        The frames share the arrival timestamp, the interval is divided evenly over them.
+        """
+        data = data[:self._noise_count - self.count]
+        data = data.reshape(len(data), -1)
+        if len(data) == 0:
+            return
+        if self.count == 0:
+            self._init_arrays(data.shape[1])
+
+        _count_batch = len(data)
+        _mean_batch = data.mean(axis=0)
+        _m2_batch = ((data - _mean_batch)**2).sum(axis=0)
+
+        _count = self.count + _count_batch
+        _delta = _mean_batch - self.mean
+        self.mean += _delta * _count_batch / _count
+        self._m2 += _m2_batch + _delta**2 * self.count * _count_batch / _count
+
+        self.timings[self.count:_count] = self._interval_ms(timestamp_ns, _count_batch)
+        self.count = _count
+
+        self._check_finished()
+
+    # Live statistics, population of all frames so far
+    def variance(self) -> np.ndarray:
+        # Sample variance s^2 = 1/(N-1) SUM((data - mean)^2)
+        return self._m2 / (self.count - 1) if self.count > 1 else np.zeros_like(self._m2)
+    def standard_deviation(self) -> np.ndarray:
+        return np.sqrt(self.variance())
+    def standard_uncertainty(self) -> np.ndarray:
+        # Uncertainty u = s / sqrt(N)
+        return self.standard_deviation() / np.sqrt(self.count)
+
+    def _init_arrays(self, size: int) -> None:
+        self.mean = np.zeros(size)
+        self._m2 = np.zeros(size)
+        self._delta = np.zeros(size)
+        self._delta_new = np.zeros(size)
+
+        # Init numpy arrays holding the history, plotting is simpler not having lists
+        _rows = len(self.x)
+        self.data_historic = np.zeros((_rows, size))
+        self.mean_historic = np.zeros((_rows, size))
+        self.uncertainty = np.zeros((_rows, size))
+
+    def finished(self) -> bool:
+        return self.count >= self._noise_count
+
+    def keeps_history(self) -> bool:
+        # History rows need every single frame
+        return self._history_step > 0
+
+    def _check_finished(self) -> None:
+        if self.count == self._noise_count and self.noise_calculated_event is not None:
             self.noise_calculated_event.set()
 
-    def _time_difference_ms(self) -> int:
-        _now = round(time.time_ns() / 1000000)
-        diff = _now - self._timing_start if (self._timing_start > 0) else 0
-        self._timing_start = _now
-        return diff
-    
-    def _calculate_uncertainty(self) -> None:
-        _sum_squared_deviation: np.ndarray = np.zeros_like(self.data_historic[0])
-        for i in range(1, self._counter):
-            _N = i + 1
-            # Standard deviation s = sqrt( 1/(N-1) SUM((data - mean)^2) )
-            _sum_squared_deviation += ( self.mean_historic[i] - self.data_historic[i] )**2
-            _s = np.sqrt( _sum_squared_deviation / (_N - 1) )
-            # Uncertainty u = s / sqrt(N)
-            self.uncertainty[i] =  _s / np.sqrt(_N) 
+    def _interval_ms(self, timestamp_ns: int, frame_count: int) -> float:
+        # Arrival timestamp of time.monotonic_ns(), taken now if not given
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        _interval = (timestamp_ns - self._last_ns) / frame_count / 1e6 if self._last_ns > 0 else 0
+        self._last_ns = timestamp_ns
+        return _interval
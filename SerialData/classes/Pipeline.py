@@ -0,0 +1,159 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+import time
+
+
+def batch_buffer(buffer: np.ndarray, shape: tuple) -> np.ndarray:
+    """
+    Buffer for a batch of shape, the given one if it holds enough frames, otherwise a new one. Batches re-use a
+    buffer that is large enough, it only grows. The caller keeps the returned buffer and uses its first shape[0] frames.
+    """
+    if buffer is None or len(buffer) < shape[0]:
+        return np.zeros(shape)
+    return buffer
+
+
+class Stage:
+    """
+    One processing step. Fused stages are called as function(data, *operands, out=buffer), NumPy ufuncs such as
+    np.add, np.multiply, np.reciprocal, np.minimum, or np.clip. Other stages as function(data, *operands) and return
+    a new array, e.g. to change the shape.
+    """
+
+    name: str = None
+    function = None
+    operands: tuple = ()
+    fused: bool = True
+    enabled: bool = True
+
+    calls: int = 0
+    elapsed_ns: int = 0
+
+
+    def __init__(self, name: str, function, operands: tuple = (), fused: bool = True) -> None:
+        self.name = name
+        self.function = function
+        self.operands = operands
+        self.fused = fused
+
+
+class Pipeline:
+    """
+    Ordered stages applied to every frame, or to batches of frames with the frame index first.
+    Fused stages write into one float64 buffer per frame shape, allocated on the first frame of the shape, the first
+    writes from the input and all following ones in place, there are no intermediate arrays. The returned array is
+    overwritten by the next call.
+    Stages can be changed while frames are processed, the list is replaced as a whole and read once per call.
+    """
+
+    _stages: list = None
+    _buffers: dict = None # Per frame shape
+    _batch_buffers: dict = None # Per frame shape, grow with the batch size
+
+
+    def __init__(self) -> None:
+        self._stages = []
+        self._buffers = {}
+        self._batch_buffers = {}
+
+    def append(self, name: str, function, *operands, fused: bool = True) -> None:
+        self.insert(len(self._stages), name, function, *operands, fused=fused)
+
+    def insert(self, index: int, name: str, function, *operands, fused: bool = True) -> None:
+        # A stage of the same name is replaced in place, index is then ignored
+        _stage = Stage(name, function, operands, fused)
+        _stages = list(self._stages)
+        _index = self._index(name)
+        if _index is None:
+            _stages.insert(index, _stage)
+        else:
+            _stages[_index] = _stage
+        self._stages = _stages
+
+    def remove(self, name: str) -> None:
+        self._stages = [_stage for _stage in self._stages if _stage.name != name]
+
+    def set(self, name: str, *operands) -> None:
+        # New operands, e.g. clip limits, take effect with the next frame
+        self._stage(name).operands = operands
+
+    def enable(self, name: str, enabled: bool = True) -> None:
+        self._stage(name).enabled = enabled
+
+    def names(self) -> list[str]:
+        return [_stage.name for _stage in self._stages]
+
+    def __contains__(self, name: str) -> bool:
+        return self._index(name) is not None
+
+    def _index(self, name: str) -> int:
+        for _index, _stage in enumerate(self._stages):
+            if _stage.name == name:
+                return _index
+        return None
+
+    def _stage(self, name: str) -> Stage:
+        _index = self._index(name)
+        if _index is None:
+            raise KeyError(f"No stage {name}.")
+        return self._stages[_index]
+
+    def run(self, data: np.ndarray, batch: bool = False) -> np.ndarray:
+        """
+        Applies all enabled stages in order. Without stages the input itself is returned.
+        """
+        _result = data
+        for _stage in self._stages:
+            if _stage.enabled is False:
+                continue
+            _start = time.perf_counter_ns()
+            if _stage.fused:
+                _out = self._buffer(_result.shape, batch)
+                # Integer frames are converted first, an integer loop would e.g. truncate the reciprocal
+                if _result.dtype != _out.dtype:
+                    np.copyto(_out, _result)
+                    _result = _out
+                _result = _stage.function(_result, *_stage.operands, out=_out)
+            else:
+                _result = _stage.function(_result, *_stage.operands)
+            _stage.elapsed_ns += time.perf_counter_ns() - _start
+            _stage.calls += 1
+        return _result
+
+    def _buffer(self, shape: tuple, batch: bool) -> np.ndarray:
+        if not batch:
+            _buffer = self._buffers.get(shape)
+            if _buffer is None:
+                _buffer = self._buffers[shape] = np.zeros(shape)
+            return _buffer
+        _buffer = self._batch_buffers[shape[1:]] = batch_buffer(self._batch_buffers.get(shape[1:]), shape)
+        return _buffer[:shape[0]]
+
+    def timings(self) -> dict:
+        """
+        Per stage in order: calls, frames of a batch count once, and mean time per call in microseconds.
+        """
+        return {_stage.name: {
+            'calls': _stage.calls,
+            'mean_us': _stage.elapsed_ns / _stage.calls / 1e3 if _stage.calls > 0 else None,
+        } for _stage in self._stages}
+
+    def reset_timings(self) -> None:
+        for _stage in self._stages:
+            _stage.calls = 0
+            _stage.elapsed_ns = 0
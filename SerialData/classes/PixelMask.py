@@ -0,0 +1,90 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+
+class PixelMask:
+    """
+    Replaces bad elements of a frame in place, from index arrays planned once for the mask. A fused stage of the
+    Pipeline, see SerialData.set_mask.
+    Modes:
+        interpolate: mean of the good direct neighbours, NaN if there is none
+        ignore: NaN, min/max and plots skip them
+    """
+    modes = ('interpolate', 'ignore')
+
+    mask: np.ndarray = None # True for bad elements
+    shape: tuple = None # Of a single frame
+    mode: str = 'interpolate'
+    count: int = 0
+
+    _bad: np.ndarray = None # Flat index of each bad element
+    _neighbours: np.ndarray = None # Flat indices of the good neighbours per bad element, padded
+    _weights: np.ndarray = None # 1 / number of good neighbours, zero for padding
+
+
+    def __init__(self, mask: np.ndarray, mode: str = 'interpolate') -> None:
+        self.mask = np.asarray(mask, dtype=bool)
+        self.shape = self.mask.shape
+        self.mode = mode
+        self._bad = np.flatnonzero(self.mask)
+        self.count = len(self._bad)
+        if mode == 'interpolate':
+            self._plan()
+
+    def _plan(self) -> None:
+        # Direct neighbours along each axis, those outside the frame or bad themselves get zero weight
+        _coordinates = np.unravel_index(self._bad, self.shape)
+        _neighbours = []
+        _valid = []
+        for _axis in range(len(self.shape)):
+            for _step in (-1, 1):
+                _shifted = list(_coordinates)
+                _shifted[_axis] = _coordinates[_axis] + _step
+                _inside = (_shifted[_axis] >= 0) & (_shifted[_axis] < self.shape[_axis])
+                _shifted[_axis] = np.clip(_shifted[_axis], 0, self.shape[_axis] - 1)
+                _index = np.ravel_multi_index(_shifted, self.shape)
+                _neighbours.append(_index)
+                _valid.append(_inside & ~self.mask.flat[_index])
+        _neighbours = np.stack(_neighbours, axis=1)
+        _valid = np.stack(_valid, axis=1)
+        # Padding points to a good neighbour as well, a bad value times zero weight could still be NaN
+        _first = _neighbours[np.arange(self.count), np.argmax(_valid, axis=1)]
+        self._neighbours = np.where(_valid, _neighbours, _first[:, None])
+        _count = np.sum(_valid, axis=1, keepdims=True)
+        self._weights = np.divide(_valid, _count, out=np.zeros(_valid.shape), where=_count > 0)
+        # Elements without any good neighbour
+        self._weights[_count[:, 0] == 0] = np.nan
+
+    def apply(self, data: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        Single frame or several frames, first axis is the frame index. Changed in place or written to out, which
+        needs to be contiguous.
+        """
+        if data.shape[data.ndim - len(self.shape):] != self.shape:
+            raise ValueError("Frame shape does not match the mask.")
+        if out is not None and out is not data:
+            np.copyto(out, data)
+            data = out
+        if self.count == 0:
+            return data
+        _flat = data.reshape(data.shape[:data.ndim - len(self.shape)] + (-1,))
+        if self.mode == 'ignore':
+            _flat[..., self._bad] = np.nan
+        else:
+            _flat[..., self._bad] = np.sum(_flat[..., self._neighbours] * self._weights, axis=-1)
+        return data
@@ -0,0 +1,125 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import os
+from datetime import datetime
+from threading import Lock
+
+
+class SessionManifest:
+    """
+    Index of the files saved to one directory, one JSON line per file in manifest.jsonl.
+    The next number of each name is kept from the manifest, numbering a file needs no directory listing. The numbered
+    file is created exclusively, if another process took the number in the meantime the next one is used.
+    Each entry holds the file name, its name and number, the save time and any metadata given, e.g. shape, averaging
+    count, offset and scaling version, description. Entries of other processes are read on the next access.
+    """
+
+    filename: str = "manifest.jsonl"
+
+    path: str = None
+    _entries: list = None
+    _next: dict = None # Next number per name
+    _read_bytes: int = 0 # Manifest read up to here
+    _lock: Lock = None
+
+
+    def __init__(self, path: str) -> None:
+        """
+        Directory of the files, created if missing.
+        """
+        self.path = path
+        self._entries = []
+        self._next = {}
+        self._lock = Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def reserve(self, name: str, extension: str) -> tuple[str, int]:
+        """
+        Next free numbered filename name_<number><extension> with path, created empty, and its number.
+        """
+        with self._lock:
+            self._sync()
+            _number = self._next.get(name, 1)
+            while True:
+                _filename = os.path.join(self.path, f"{name}_{_number}{extension}")
+                try:
+                    # Exclusive create, fails if the file exists, also between processes
+                    os.close(os.open(_filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                    break
+                except FileExistsError:
+                    _number += 1
+            self._next[name] = _number + 1
+            return _filename, _number
+
+    def add(self, filename: str, name: str, number: int = None, **metadata) -> dict:
+        """
+        Appends the entry of a saved file, metadata must be JSON serializable.
+        """
+        _entry = {
+            'file': os.path.basename(filename),
+            'name': name,
+            'number': number,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            **metadata,
+        }
+        # A single write of a whole line, appends of several processes do not mix
+        _line = (json.dumps(_entry) + "\n").encode('utf-8')
+        with self._lock:
+            self._sync()
+            with open(self._manifest_filename(), 'ab') as _file:
+                _file.write(_line)
+            # Read back with any lines of other processes before it, the own line is among them
+            self._sync()
+        return _entry
+
+    def entries(self, **match) -> list[dict]:
+        """
+        Entries in the order saved, only those with all given fields equal, e.g. entries(name='sample').
+        """
+        with self._lock:
+            self._sync()
+            return [_entry for _entry in self._entries if all(_entry.get(_key) == _value for _key, _value in match.items())]
+
+    def latest(self, name: str) -> dict:
+        # Last entry of the name, None if there is none
+        _entries = self.entries(name=name)
+        return _entries[-1] if len(_entries) > 0 else None
+
+    def _manifest_filename(self) -> str:
+        return os.path.join(self.path, self.filename)
+
+    def _sync(self) -> None:
+        # Read lines appended since the last access, a line still being written is left for the next one
+        try:
+            with open(self._manifest_filename(), 'rb') as _file:
+                _file.seek(self._read_bytes)
+                _new = _file.read()
+        except FileNotFoundError:
+            return
+        _end = _new.rfind(b"\n") + 1
+        for _line in _new[:_end].splitlines():
+            try:
+                self._read_entry(json.loads(_line))
+            except ValueError:
+                print("Warning: Skipped broken manifest line.")
+        self._read_bytes += _end
+
+    def _read_entry(self, entry: dict) -> None:
+        self._entries.append(entry)
+        if entry.get('number') is not None:
+            self._next[entry['name']] = max(self._next.get(entry['name'], 1), entry['number'] + 1)
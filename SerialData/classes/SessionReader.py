@@ -0,0 +1,137 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+from typing import Iterator
+
+from SerialData.classes.DataMean import DataMean
+from SerialData.classes.Noise import Noise
+
+
+# Values per chunk when iterating, about 32 MB of float64
+_chunk_values = 2**22
+
+
+class SessionReader:
+    """
+    Reads a recording of SessionRecorder without loading it: frames and index are memory mapped, only the pages
+    actually read are loaded by the operating system.
+    Timestamps are increasing, seeking by time is a binary search. Frames are selected by range and by pixel, flat
+    indices in row-major order, and can be iterated in chunks, for example into NoiseAnalysis.
+    A recording still being written is read up to its last flush, refresh() maps the frames flushed since.
+    """
+
+    filename: str = None
+    frames: np.ndarray = None # Memory mapped, frame index first
+    index: np.ndarray = None # Memory mapped, timestamp_ns and sequence of each frame
+    shape: tuple = None # Shape of a single frame
+    _count: int = 0
+
+
+    def __init__(self, filename: str) -> None:
+        """
+        Filename without extension, as given to SessionRecorder.
+        """
+        self.filename = filename
+        self.refresh()
+
+    def refresh(self) -> None:
+        self.frames = np.load(f"{self.filename}.npy", mmap_mode='r')
+        self.index = np.load(f"{self.filename}_index.npy", mmap_mode='r')
+        # Headers are updated one after the other, only frames with both are complete
+        self._count = min(len(self.frames), len(self.index))
+        self.shape = self.frames.shape[1:]
+
+    def __len__(self) -> int:
+        return self._count
+
+    # Arrival time.monotonic_ns() and sequence number of each frame, memory mapped
+    def timestamps(self) -> np.ndarray:
+        return self.index['timestamp_ns'][:self._count]
+    def sequence(self) -> np.ndarray:
+        return self.index['sequence'][:self._count]
+
+    def seek(self, timestamp_ns: int) -> int:
+        # First frame at or after the timestamp, len() if there is none
+        return int(np.searchsorted(self.timestamps(), timestamp_ns, side='left'))
+
+    def time_range(self, start_ns: int = None, stop_ns: int = None) -> slice:
+        # Frames from start up to excluding stop, open ends if not given
+        _start = 0 if start_ns is None else self.seek(start_ns)
+        _stop = self._count if stop_ns is None else self.seek(stop_ns)
+        return slice(_start, _stop)
+
+    def duration_s(self) -> float:
+        if self._count < 2:
+            return 0.
+        return (int(self.index['timestamp_ns'][self._count - 1]) - int(self.index['timestamp_ns'][0])) / 1e9
+
+    def dropped(self) -> int:
+        # Frames missing from gaps in the sequence numbers, e.g. dropped writes
+        if self._count < 2:
+            return 0
+        return int(self.index['sequence'][self._count - 1] - self.index['sequence'][0]) + 1 - self._count
+
+    def read(self, start: int = 0, stop: int = None, pixels: np.ndarray = None) -> np.ndarray:
+        """
+        Frames from start up to excluding stop. A memory mapped view, or a copy of the selected flat pixels only.
+        """
+        _frames = self.frames[start:self._count if stop is None else min(stop, self._count)]
+        if pixels is None:
+            return _frames
+        return _frames.reshape(len(_frames), -1)[:, pixels]
+
+    def chunks(self, start: int = 0, stop: int = None, pixels: np.ndarray = None, chunk_frames: int = None) -> Iterator[np.ndarray]:
+        # Consecutive frame ranges as returned by read, sized to about 32 MB by default
+        _stop = self._count if stop is None else min(stop, self._count)
+        if chunk_frames is None:
+            chunk_frames = max(_chunk_values // max(int(np.prod(self.shape)), 1), 1)
+        for _start in range(start, _stop, chunk_frames):
+            yield self.read(_start, min(_start + chunk_frames, _stop), pixels)
+
+    ### Offline reprocessing, offset and scaling as in SerialData, zero and unity if not given
+
+    def mean(self, start: int = 0, stop: int = None, offset: np.ndarray = None, scaling: np.ndarray = None,
+             avg_count: int = None, mode: str = 'cumulative') -> DataMean:
+        """
+        Mean of the frames, of all of them by default, or the rolling mean at the end of the range.
+        """
+        _stop = self._count if stop is None else min(stop, self._count)
+        _offset, _scaling = self._offset_scaling(offset, scaling)
+        _mean = DataMean(_offset, _scaling, max(_stop - start, 1) if avg_count is None else avg_count, None, mode)
+        for _chunk in self.chunks(start, _stop):
+            _mean.update_batch(np.asarray(_chunk, dtype=float))
+        return _mean
+
+    def noise(self, start: int = 0, stop: int = None, offset: np.ndarray = None, scaling: np.ndarray = None) -> Noise:
+        """
+        Noise statistics of the scaled frames, no history is kept.
+        """
+        _stop = self._count if stop is None else min(stop, self._count)
+        _offset, _scaling = self._offset_scaling(offset, scaling)
+        _noise = Noise(max(_stop - start, 1), None, history_step=0)
+        for _chunk in self.chunks(start, _stop):
+            _noise.update_batch((_chunk + _offset) * _scaling)
+
+        # Exact intervals from the recorded timestamps, first is zero
+        _timestamps = np.asarray(self.timestamps()[start:_stop])
+        _noise.timings[:len(_timestamps)] = np.diff(_timestamps, prepend=_timestamps[:1]) / 1e6
+        return _noise
+
+    def _offset_scaling(self, offset: np.ndarray, scaling: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        _offset = np.zeros(self.shape) if offset is None else offset
+        _scaling = np.ones(self.shape) if scaling is None else scaling
+        return _offset, _scaling
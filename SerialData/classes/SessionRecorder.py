@@ -0,0 +1,208 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+import time
+from threading import Lock
+
+from SerialData.classes.FileWriter import FileWriter
+
+
+# Index entry of each frame, arrival time.monotonic_ns() and sequence number
+index_dtype = np.dtype([('timestamp_ns', '<i8'), ('sequence', '<i8')])
+
+# Header of the growing .npy files, room for the frame count to be rewritten in place
+_npy_magic = b'\x93NUMPY\x01\x00'
+_npy_count_width = 20
+
+
+class SessionRecorder:
+    """
+    Appends frames to a single .npy file and their timestamp and sequence number to a matching _index.npy file.
+    Both are plain .npy files growing in place: frames are collected in a preallocated chunk and written in one go,
+    the frame count in the header is updated at every flush. After a crash the files hold all frames up to the last flush.
+    Both can be memory mapped with np.load(filename, mmap_mode='r').
+    Recording usually runs in the serial thread, closing from another thread is safe, later frames are ignored.
+    With a FileWriter all file access runs in its thread, full chunks are copied to the queue. A dropped chunk is
+    missing in both files, its sequence numbers reveal the gap.
+    """
+
+    frames: int = 0 # Frames written to disk
+    _count: int = 0 # Frames recorded, also the next sequence number
+
+    filename: str = None
+    _file = None
+    _index_file = None
+    _shape: tuple = None
+    _dtype: np.dtype = None
+
+    _chunk: np.ndarray = None
+    _index_chunk: np.ndarray = None
+    _chunk_frames: int = 256
+    _pending: int = 0 # Frames in the chunk
+
+    _flush_interval_ns: int = 0
+    _last_flush_ns: int = 0
+
+    _lock: Lock = None
+    _closed: bool = False
+    _writer: FileWriter = None
+
+
+    def __init__(self, filename: str, flush_interval_s: float = 1., chunk_frames: int = 256, writer: FileWriter = None) -> None:
+        """
+        Filename without extension, the files are opened with the first frame.
+        """
+        self.filename = filename
+        self._flush_interval_ns = int(flush_interval_s * 1e9)
+        self._chunk_frames = chunk_frames
+        self._writer = writer
+        self._lock = Lock()
+
+    def record(self, array: np.ndarray, timestamp_ns: int = None, sequence: int = None) -> None:
+        with self._lock:
+            self._record(array, timestamp_ns, sequence)
+
+    def record_batch(self, frames: np.ndarray, timestamp_ns: int = None) -> None:
+        # Several frames at once, first axis is the frame index, all share the timestamp
+        with self._lock:
+            self._record_batch(frames, timestamp_ns)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._shape is None:
+                return
+            self._flush()
+            self._run(self._close_files)
+
+    def _record(self, array: np.ndarray, timestamp_ns: int, sequence: int) -> None:
+        # Frames that do not match the shape of the first one are ignored
+        if self._closed:
+            return
+        if self._shape is None:
+            self._open(array)
+        elif array.shape != self._shape:
+            return
+
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        self._chunk[self._pending] = array
+        self._index_chunk[self._pending] = (timestamp_ns, self._count if sequence is None else sequence)
+        self._pending += 1
+        self._count += 1
+
+        if self._pending == self._chunk_frames:
+            self._write_chunk()
+        if timestamp_ns - self._last_flush_ns > self._flush_interval_ns:
+            self._flush()
+
+    def _record_batch(self, frames: np.ndarray, timestamp_ns: int) -> None:
+        if self._closed or len(frames) == 0:
+            return
+        if self._shape is None:
+            self._open(frames[0])
+        elif frames.shape[1:] != self._shape:
+            return
+
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        _start = 0
+        while _start < len(frames):
+            _count = min(self._chunk_frames - self._pending, len(frames) - _start)
+            self._chunk[self._pending:self._pending + _count] = frames[_start:_start + _count]
+            self._index_chunk['timestamp_ns'][self._pending:self._pending + _count] = timestamp_ns
+            self._index_chunk['sequence'][self._pending:self._pending + _count] = np.arange(self._count, self._count + _count)
+            self._pending += _count
+            self._count += _count
+            _start += _count
+            if self._pending == self._chunk_frames:
+                self._write_chunk()
+
+        if timestamp_ns - self._last_flush_ns > self._flush_interval_ns:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._shape is None:
+            return
+        self._write_chunk()
+        self._run(self._write_headers)
+        self._last_flush_ns = time.monotonic_ns()
+
+    def _open(self, array: np.ndarray) -> None:
+        self._shape = array.shape
+        self._dtype = np.dtype(array.dtype).newbyteorder('<')
+        self._chunk = np.zeros((self._chunk_frames,) + self._shape, dtype=self._dtype)
+        self._index_chunk = np.zeros(self._chunk_frames, dtype=index_dtype)
+        self._run(self._open_files)
+        self._last_flush_ns = time.monotonic_ns()
+
+    def _write_chunk(self) -> None:
+        if self._pending == 0:
+            return
+        if self._writer is None:
+            self._write_data(memoryview(self._chunk[:self._pending]), memoryview(self._index_chunk[:self._pending]), self._pending)
+        else:
+            # The chunk is re-used right away, the only write that may be dropped, frames counts only what is written
+            self._writer.submit_droppable(self._write_data, self._chunk[:self._pending].tobytes(), self._index_chunk[:self._pending].tobytes(), self._pending)
+        self._pending = 0
+
+    def _run(self, function) -> None:
+        # File access right away or in the writer thread, in order with the chunks
+        if self._writer is None:
+            function()
+        else:
+            self._writer.submit(function)
+
+    # File access, in the writer thread if there is one
+    def _open_files(self) -> None:
+        self._file = open(f"{self.filename}.npy", 'wb')
+        self._index_file = open(f"{self.filename}_index.npy", 'wb')
+        _write_npy_header(self._file, self._dtype, (0,) + self._shape)
+        _write_npy_header(self._index_file, index_dtype, (0,))
+
+    def _write_data(self, frames: bytes, index: bytes, count: int) -> None:
+        self._file.write(frames)
+        self._index_file.write(index)
+        self.frames += count
+
+    def _write_headers(self) -> None:
+        for _file, _shape, _dtype in ((self._file, self._shape, self._dtype), (self._index_file, (), index_dtype)):
+            _file.flush()
+            _file.seek(0)
+            _write_npy_header(_file, _dtype, (self.frames,) + _shape)
+            _file.seek(0, 2)
+            _file.flush()
+
+    def _close_files(self) -> None:
+        self._file.close()
+        self._index_file.close()
+        print(f"Recorded {self.frames} frames to {self.filename}.npy")
+
+
+def _write_npy_header(file, dtype: np.dtype, shape: tuple) -> None:
+    # Version 1.0 header, the frame count is padded to a fixed width so the header can be rewritten in place
+    _shape = f"({shape[0]:{_npy_count_width}d}," + ''.join(f" {_size}," for _size in shape[1:]) + ")"
+    _header = f"{{'descr': {np.lib.format.dtype_to_descr(dtype)!r}, 'fortran_order': False, 'shape': {_shape}, }}"
+    # Data starts aligned to 64 bytes, the header ends with a newline
+    _length = -(-(len(_npy_magic) + 2 + len(_header) + 1) // 64) * 64 - len(_npy_magic) - 2
+    file.write(_npy_magic + _length.to_bytes(2, 'little') + _header.ljust(_length - 1).encode('latin1') + b'\n')
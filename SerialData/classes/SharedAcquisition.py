@@ -0,0 +1,104 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import multiprocessing
+
+from SerialData.classes.SharedData import SharedData
+
+
+class SharedAcquisition:
+    """
+    Runs the serial acquisition in a process of its own and writes every frame after the data function into a
+    shared memory ring, see SharedFrameRing. Analysis and display processes attach by name with SharedData, their
+    load or a slow redraw never delays reading the serial port.
+    The data function needs to be picklable, a module level function and not a lambda, as it is sent to the process.
+    """
+
+    name: str = None # Of the shared memory ring, to attach from other processes
+
+    _port: str = None
+    _avg_count: int = 3
+    _bulk_read: bool = False
+    _binary: bool = False
+    _depth: int = 1024
+    _data_function = None
+
+    _process: multiprocessing.Process = None
+    _stop_event = None
+
+
+    def __init__(self, port: str, avg_count: int = 3, bulk_read: bool = False, binary: bool = False, depth: int = 1024, data_function = None) -> None:
+        """
+        Depth is the number of frames in the ring, a reader further behind loses frames.
+        """
+        self._port = port
+        self._avg_count = avg_count
+        self._bulk_read = bulk_read
+        self._binary = binary
+        self._depth = depth
+        self._data_function = data_function
+
+    def start(self, timeout: float = None) -> str:
+        """
+        Starts the process and waits for the first frame, which sets the shape of the ring. Returns the ring name.
+        """
+        _queue = multiprocessing.Queue()
+        self._stop_event = multiprocessing.Event()
+        self._process = multiprocessing.Process(target=_acquisition_process, args=(
+            self._port, self._avg_count, self._bulk_read, self._binary, self._depth, self._data_function, _queue, self._stop_event))
+        self._process.start()
+        self.name = _queue.get(timeout=timeout)
+        print(f"Shared acquisition started, ring {self.name}.")
+        return self.name
+
+    def attach(self, avg_count: int = None, avg_mode: str = 'exponential') -> SharedData:
+        # Reader in this process, other processes use SharedData(name)
+        return SharedData(self.name, self._avg_count if avg_count is None else avg_count, avg_mode)
+
+    def stop(self) -> None:
+        if self._process is None:
+            return
+        self._stop_event.set()
+        self._process.join()
+        self._process = None
+        print("Shared acquisition stopped.")
+
+
+def _acquisition_process(port: str, avg_count: int, bulk_read: bool, binary: bool, depth: int, data_function, queue, stop_event) -> None:
+    # Imported here, the reading processes do not need serial
+    from SerialData.SerialData import SerialData
+    from SerialData.classes.SharedFrameRing import SharedFrameRing
+
+    serialData = SerialData(port, avg_count, bulk_read, binary)
+    if data_function is not None:
+        serialData.set_data_function(data_function)
+    # Frames that arrive while the ring is created are kept
+    _subscription = serialData.subscribe('drop_oldest', depth)
+    serialData.wait_for_serial()
+
+    _ring = SharedFrameRing(shape=serialData._shape, depth=depth)
+    queue.put(_ring.name)
+    try:
+        while not stop_event.is_set():
+            _item = _subscription.get(timeout=0.1)
+            # Frames that changed shape since acquisition start do not fit
+            if _item is None or _item[2].shape != _ring.shape:
+                continue
+            _ring.write(*_item)
+    finally:
+        _ring.stop()
+        serialData.stop_serial()
+        _ring.close()
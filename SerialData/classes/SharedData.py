@@ -0,0 +1,145 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+import time
+from threading import Event
+
+from SerialData.classes.Data import Data
+from SerialData.classes.DataMean import DataMean
+from SerialData.classes.SharedFrameRing import SharedFrameRing
+
+
+class SharedData:
+    """
+    Reads the frames of an acquisition process from its shared memory ring, see SharedAcquisition.
+    Frames are fed into own Data and DataMean with the same API as in SerialData, offset and scaling are per reader.
+    Reading only copies from the ring, the acquisition is never blocked. A reader that falls more than the ring depth
+    behind skips the frames overwritten meanwhile, they are counted as dropped, and continues with the oldest left.
+    Latency is measured from the arrival of the bytes in the acquisition process until the frame is read here.
+    """
+
+    data: Data = None
+    mean: DataMean = None
+    avg_count_reached_event: Event = None
+
+    _ring: SharedFrameRing = None
+    _next: int = 0 # Write count of the next frame to read
+    _offset: np.ndarray = None
+    _scaling: np.ndarray = None
+    _avg_count: int = 3
+    _avg_mode: str = 'exponential'
+
+    frames: int = 0
+    dropped: int = 0
+    _latency_sum_ns: int = 0
+    _latency_max_ns: int = 0
+    _latency_last_ns: int = 0
+    _write_sum_ns: int = 0 # Arrival until written to the ring
+
+
+    def __init__(self, name: str, avg_count: int = 3, avg_mode: str = 'exponential', offset: np.ndarray = None, scaling: np.ndarray = None) -> None:
+        """
+        Attaches to the ring of the name, reading starts with the next frame written.
+        """
+        self._ring = SharedFrameRing(name)
+        self._next = self._ring.count()
+        self._avg_count = max(avg_count, 2)
+        self._avg_mode = avg_mode
+        self._offset = np.zeros(self._ring.shape) if offset is None else offset
+        self._scaling = np.ones(self._ring.shape) if scaling is None else scaling
+        self.avg_count_reached_event = Event()
+        self._clear_data()
+
+    def shape(self) -> tuple:
+        return self._ring.shape
+
+    def set_offset(self, offset: np.ndarray) -> None:
+        self._offset = offset
+        self._clear_data()
+
+    def set_scaling(self, scaling: np.ndarray) -> None:
+        self._scaling = scaling
+        self._clear_data()
+
+    def restart_data_acquisition(self) -> None:
+        self._clear_data()
+
+    def _clear_data(self) -> None:
+        self.avg_count_reached_event.clear()
+        self.data = Data(self._offset, self._scaling)
+        self.mean = DataMean(self._offset, self._scaling, self._avg_count, self.avg_count_reached_event, self._avg_mode)
+
+    def update(self, max_frames: int = None) -> int:
+        """
+        Feeds all frames written since the last call into data and mean, returns their number.
+        """
+        _start, _frames, _sequence, _timestamps, _written_ns = self._ring.read(self._next, max_frames)
+        self.dropped += _start - self._next
+        self._next = _start + len(_frames)
+        if len(_frames) == 0:
+            return 0
+
+        _now = time.monotonic_ns()
+        self.data.update_batch(_frames, int(_timestamps[-1]))
+        self.mean.update_batch(_frames)
+
+        _latency = _now - _timestamps
+        self.frames += len(_frames)
+        self._latency_sum_ns += int(np.sum(_latency))
+        self._latency_max_ns = max(self._latency_max_ns, int(np.max(_latency)))
+        self._latency_last_ns = int(_latency[-1])
+        self._write_sum_ns += int(np.sum(_written_ns - _timestamps))
+        return len(_frames)
+
+    def wait_for_frames(self, timeout: float = None, interval_s: float = 0.001, max_interval_s: float = 0.05) -> int:
+        """
+        Updates until there is at least one new frame, returns their number, zero on timeout or if acquisition stopped.
+        There is no notification between processes, the ring is checked after interval_s, doubling up to max_interval_s
+        while nothing arrives.
+        """
+        _deadline = None if timeout is None else time.monotonic() + timeout
+        _interval = interval_s
+        while True:
+            _count = self.update()
+            if _count > 0 or self._ring.stopped():
+                return _count
+            if _deadline is not None and time.monotonic() > _deadline:
+                return 0
+            time.sleep(_interval)
+            _interval = min(_interval * 2, max_interval_s)
+
+    def stopped(self) -> bool:
+        return self._ring.stopped()
+
+    def stats(self) -> dict:
+        """
+        Frames read and dropped, latency from arrival to read in milliseconds, and mean time from arrival until written.
+        """
+        return {
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'behind': self._ring.count() - self._next,
+            'latency_mean_ms': self._latency_sum_ns / self.frames / 1e6 if self.frames > 0 else None,
+            'latency_max_ms': self._latency_max_ns / 1e6,
+            'latency_last_ms': self._latency_last_ns / 1e6,
+            'write_mean_ms': self._write_sum_ns / self.frames / 1e6 if self.frames > 0 else None,
+        }
+
+    def close(self) -> None:
+        self.data = None
+        self.mean = None
+        self._ring.close()
@@ -0,0 +1,155 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+
+# Header of int64 values at the start of the shared memory
+_magic = 0x4D565033 # MVP3
+_header_size = 8
+_MAGIC, _DEPTH, _NDIM, _ROWS, _COLS, _COUNT, _STOPPED = range(7)
+
+
+class SharedFrameRing:
+    """
+    Ring buffer of frames in shared memory, written by a single process and read by any number of others.
+    Each slot holds the frame as float64, its sequence number as published by SerialData, counting all frames of the
+    acquisition, arrival timestamp and write time in ns of time.monotonic_ns(), which is the same clock in all
+    processes of a machine.
+    Readers never block the writer, their mapping of the memory is read-only. A slot is marked while it is written, readers check the mark after copying and
+    discard frames that were overwritten meanwhile. A reader more than depth frames behind loses the oldest ones.
+    """
+
+    name: str = None
+    depth: int = 0
+    shape: tuple = None
+
+    _memory: shared_memory.SharedMemory = None
+    _header: np.ndarray = None
+    _slot_count: np.ndarray = None # Write count of the frame in each slot, -1 while written
+    _sequence: np.ndarray = None
+    _timestamps: np.ndarray = None
+    _written_ns: np.ndarray = None
+    _frames: np.ndarray = None
+    _owner: bool = False
+
+
+    def __init__(self, name: str = None, shape: tuple = None, depth: int = 1024) -> None:
+        """
+        With shape a new ring is created, its name is then generated if not given. Without shape the ring of the
+        name is attached.
+        """
+        if shape is not None:
+            _size = int(np.prod(shape))
+            self._memory = shared_memory.SharedMemory(name, create=True, size=8 * (_header_size + depth * (4 + _size)))
+            self._owner = True
+            self._map(depth, tuple(shape))
+            self._header[:] = 0
+            self._header[_MAGIC] = _magic
+            self._header[_DEPTH] = depth
+            self._header[_NDIM] = len(shape)
+            self._header[_ROWS:_ROWS + len(shape)] = shape
+            self._slot_count[:] = -1
+        else:
+            self._memory = _attach(name)
+            _header = np.ndarray(_header_size, dtype=np.int64, buffer=self._memory.buf)
+            if _header[_MAGIC] != _magic:
+                raise ValueError(f"{name} is not a frame ring.")
+            self._map(int(_header[_DEPTH]), tuple(int(_size) for _size in _header[_ROWS:_ROWS + _header[_NDIM]]))
+            for _array in (self._header, self._slot_count, self._sequence, self._timestamps, self._written_ns, self._frames):
+                _array.flags.writeable = False
+        self.name = self._memory.name
+
+    def _map(self, depth: int, shape: tuple) -> None:
+        self.depth = depth
+        self.shape = shape
+        _offset = 0
+        def _array(_shape: tuple, _dtype) -> np.ndarray:
+            nonlocal _offset
+            _array = np.ndarray(_shape, dtype=_dtype, buffer=self._memory.buf, offset=_offset)
+            _offset += _array.nbytes
+            return _array
+        self._header = _array(_header_size, np.int64)
+        self._slot_count = _array(depth, np.int64)
+        self._sequence = _array(depth, np.int64)
+        self._timestamps = _array(depth, np.int64)
+        self._written_ns = _array(depth, np.int64)
+        self._frames = _array((depth,) + shape, np.float64)
+
+    def write(self, sequence: int, timestamp_ns: int, frame: np.ndarray) -> None:
+        _count = int(self._header[_COUNT])
+        _slot = _count % self.depth
+        self._slot_count[_slot] = -1
+        self._frames[_slot] = frame
+        self._sequence[_slot] = sequence
+        self._timestamps[_slot] = timestamp_ns
+        self._written_ns[_slot] = time.monotonic_ns()
+        self._slot_count[_slot] = _count
+        self._header[_COUNT] = _count + 1
+
+    def count(self) -> int:
+        # Frames written in total
+        return int(self._header[_COUNT])
+
+    def read(self, start: int, max_frames: int = None) -> tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Copies of the frames from write count start on, up to max_frames. Returns the write count of the first frame
+        returned, larger than start if older frames were overwritten, then frames, sequence numbers, arrival
+        timestamps and write times.
+        """
+        _count = self.count()
+        _start = max(start, _count - self.depth)
+        _stop = _count if max_frames is None else min(_count, _start + max_frames)
+        _slots = np.arange(_start, _stop) % self.depth
+
+        _frames = self._frames[_slots]
+        _sequence = self._sequence[_slots]
+        _timestamps = self._timestamps[_slots]
+        _written_ns = self._written_ns[_slots]
+        # Frames overwritten while copying are the oldest ones, they are dropped
+        _overwritten = np.flatnonzero(self._slot_count[_slots] != np.arange(_start, _stop))
+        _first = 0 if len(_overwritten) == 0 else int(_overwritten[-1]) + 1
+        return _start + _first, _frames[_first:], _sequence[_first:], _timestamps[_first:], _written_ns[_first:]
+
+    def stop(self) -> None:
+        # Tells readers that no more frames follow
+        self._header[_STOPPED] = 1
+
+    def stopped(self) -> bool:
+        return bool(self._header[_STOPPED])
+
+    def close(self) -> None:
+        # Arrays need to be released before the memory can be closed
+        self._header = self._slot_count = self._sequence = self._timestamps = self._written_ns = self._frames = None
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Attached memory must not be unlinked when the reader exits, only the creator does
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13
+        _memory = shared_memory.SharedMemory(name)
+        try:
+            resource_tracker.unregister(_memory._name, 'shared_memory')
+        except Exception:
+            pass
+        return _memory
@@ -0,0 +1,356 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import base64
+import hashlib
+import json
+import numpy as np
+import struct
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Lock, Thread
+
+from SerialData.SerialData import SerialData
+from SerialData.classes.Subscription import Subscription
+
+
+# Binary message: type 0 key frame or 1 delta, rows, cols, sequence, timestamp_ns, then the deflated float32 words
+_message_header = struct.Struct('<BxHHIq')
+_websocket_guid = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class StreamServer:
+    """
+    Streams frames to browsers over a WebSocket, with a live view page at http://host:port/, standard library only.
+    The acquisition thread only feeds a single subscription. One thread converts the latest frame to float32, each
+    viewer has its own thread that encodes and sends at the frame rate the viewer asked for, frames in between are skipped.
+    Frames are sent as the XOR of the float32 words with the previous frame sent to that viewer, deflated: unchanged
+    elements and high bits cost almost nothing and the frame is restored exactly. The first frame and frames after a
+    shape change are key frames.
+    Viewers send {"max_fps": 10} as text to set their rate, limited to max_fps of the server.
+    Binds to localhost by default, forward the port e.g. with ssh -L 8000:localhost:8000 to view a headless box.
+    """
+
+    serialData: SerialData = None
+    host: str = '127.0.0.1'
+    port: int = 8000
+    max_fps: float = 30.
+
+    _array = None # Callable of the published frame returning the frame to stream
+    _subscription: Subscription = None
+    _server: ThreadingHTTPServer = None
+    __stopped: bool = False
+
+    # Latest frame as float32, shared read-only by all viewers
+    _condition: Condition = None
+    _frame: np.ndarray = None
+    _sequence: int = -1
+    _timestamp_ns: int = 0
+
+    _viewers: int = 0
+    _frames_sent: int = 0
+    _bytes_sent: int = 0
+    _stats_lock: Lock = None
+
+
+    def __init__(self, serialData: SerialData, array = None, host: str = '127.0.0.1', port: int = 8000, max_fps: float = 30.) -> None:
+        """
+        Array is a callable of each published frame, the frame after the pipeline, returning the frame to stream.
+        By default offset and scaling are applied. Frames come from an own subscription, never from the live data
+        that the acquisition thread changes meanwhile.
+        """
+        self.serialData = serialData
+        self._array = (lambda _frame: (_frame + serialData._offset) * serialData._scaling) if array is None else array
+        self.host = host
+        self.port = port
+        self.max_fps = max_fps
+        self._condition = Condition()
+        self._stats_lock = Lock()
+
+    def start(self) -> None:
+        self.__stopped = False
+        self._subscription = self.serialData.subscribe('keep_latest')
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stream = self
+        Thread(target=self._frame_thread).start()
+        Thread(target=self._server.serve_forever).start()
+        print(f"Streaming to http://{self.host}:{self._server.server_address[1]}/")
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+        self.__stopped = True
+        self.serialData.unsubscribe(self._subscription)
+        with self._condition:
+            self._condition.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        print("Streaming stopped.")
+
+    def stats(self) -> dict:
+        # Viewers connected, frames and bytes sent to all of them
+        return {
+            'viewers': self._viewers,
+            'frames_sent': self._frames_sent,
+            'bytes_sent': self._bytes_sent,
+        }
+
+    def _frame_thread(self) -> None:
+        # Latest frame for the viewers, converted once for all of them
+        while self.__stopped is False:
+            _item = self._subscription.get(timeout=1)
+            if self._subscription.closed:
+                break
+            if _item is None or self._viewers == 0:
+                continue
+            try:
+                _frame = np.array(self._array(_item[2]), dtype='<f4')
+            except ValueError:
+                # Offset or scaling of another shape, until the acquisition restarted
+                continue
+            with self._condition:
+                self._frame = _frame
+                self._sequence, self._timestamp_ns = _item[0], _item[1]
+                self._condition.notify_all()
+
+    def _serve_viewer(self, handler: BaseHTTPRequestHandler) -> None:
+        # Runs in the thread of the viewer connection until it is closed
+        _key = handler.headers.get('Sec-WebSocket-Key', '')
+        _accept = base64.b64encode(hashlib.sha1((_key + _websocket_guid).encode()).digest()).decode()
+        handler.send_response(101, "Switching Protocols")
+        handler.send_header('Upgrade', 'websocket')
+        handler.send_header('Connection', 'Upgrade')
+        handler.send_header('Sec-WebSocket-Accept', _accept)
+        handler.end_headers()
+        handler.wfile.flush()
+
+        _viewer = _Viewer(handler, self.max_fps)
+        Thread(target=self._receive_thread, args=(_viewer,)).start()
+        with self._stats_lock:
+            self._viewers += 1
+        try:
+            self._send_loop(_viewer)
+        except OSError:
+            pass
+        finally:
+            _viewer.closed = True
+            with self._stats_lock:
+                self._viewers -= 1
+
+    def _send_loop(self, viewer: '_Viewer') -> None:
+        _sequence = -1
+        while self.__stopped is False and viewer.closed is False:
+            # Rate limit of the viewer, frames arriving meanwhile are skipped
+            _wait = viewer.next_ns - time.monotonic_ns()
+            if _wait > 0:
+                time.sleep(_wait / 1e9)
+
+            with self._condition:
+                if not self._condition.wait_for(lambda: self._sequence != _sequence or self.__stopped or viewer.closed, timeout=1):
+                    continue
+                if self.__stopped or viewer.closed:
+                    break
+                _frame, _sequence, _timestamp_ns = self._frame, self._sequence, self._timestamp_ns
+
+            _message = viewer.encode(_frame, _sequence, _timestamp_ns)
+            viewer.send(0x2, _message)
+            viewer.next_ns = time.monotonic_ns() + int(1e9 / viewer.max_fps)
+            with self._stats_lock:
+                self._frames_sent += 1
+                self._bytes_sent += len(_message)
+
+    def _receive_thread(self, viewer: '_Viewer') -> None:
+        # Text messages set the frame rate, answers pings, ends with close
+        try:
+            while viewer.closed is False:
+                _opcode, _payload = viewer.receive()
+                if _opcode == 0x8:
+                    viewer.send(0x8, _payload[:2])
+                    break
+                if _opcode == 0x9:
+                    viewer.send(0xA, _payload)
+                elif _opcode == 0x1:
+                    try:
+                        _max_fps = json.loads(_payload.decode('utf-8')).get('max_fps')
+                    except (ValueError, AttributeError):
+                        print("Warning: Ignoring a malformed message from a viewer.")
+                        continue
+                    # Anything but a positive number is ignored
+                    try:
+                        _max_fps = float(_max_fps)
+                    except (TypeError, ValueError):
+                        continue
+                    if _max_fps > 0:
+                        viewer.max_fps = min(_max_fps, self.max_fps)
+        except (OSError, ValueError, AttributeError):
+            pass
+        viewer.closed = True
+        # Wake the sending thread of the viewer
+        with self._condition:
+            self._condition.notify_all()
+
+
+class _Viewer:
+    """
+    Connection of a single viewer with its frame rate and the previous frame sent for delta encoding.
+    """
+
+    closed: bool = False
+    max_fps: float = 30.
+    next_ns: int = 0
+    _previous: np.ndarray = None # Words of the previous frame sent
+    _handler: BaseHTTPRequestHandler = None
+    _send_lock: Lock = None
+
+
+    def __init__(self, handler: BaseHTTPRequestHandler, max_fps: float) -> None:
+        self._handler = handler
+        self.max_fps = max_fps
+        self._send_lock = Lock()
+
+    def encode(self, frame: np.ndarray, sequence: int, timestamp_ns: int) -> bytes:
+        _rows, _cols = frame.shape if frame.ndim == 2 else (1, frame.size)
+        _words = frame.view('<u4').ravel()
+        _key = self._previous is None or self._previous.shape != _words.shape
+        _payload = _words if _key else np.bitwise_xor(_words, self._previous)
+        self._previous = _words
+        return _message_header.pack(0 if _key else 1, _rows, _cols, sequence % 2**32, timestamp_ns) + zlib.compress(_payload.tobytes(), 1)
+
+    def send(self, opcode: int, payload: bytes) -> None:
+        # Server frames are not masked
+        _length = len(payload)
+        if _length < 126:
+            _header = struct.pack('!BB', 0x80 | opcode, _length)
+        elif _length < 2**16:
+            _header = struct.pack('!BBH', 0x80 | opcode, 126, _length)
+        else:
+            _header = struct.pack('!BBQ', 0x80 | opcode, 127, _length)
+        with self._send_lock:
+            self._handler.wfile.write(_header + payload)
+            self._handler.wfile.flush()
+
+    def receive(self) -> tuple[int, bytes]:
+        # Client frames are masked, fragmented messages are not expected for the short text sent
+        _read = self._handler.rfile.read
+        _first, _second = _read(2)
+        _length = _second & 0x7F
+        if _length == 126:
+            _length = struct.unpack('!H', _read(2))[0]
+        elif _length == 127:
+            _length = struct.unpack('!Q', _read(8))[0]
+        _mask = _read(4) if _second & 0x80 else b'\x00' * 4
+        _payload = np.frombuffer(_read(_length), dtype=np.uint8)
+        _payload = np.bitwise_xor(_payload, np.resize(np.frombuffer(_mask, dtype=np.uint8), _length))
+        return _first & 0x0F, _payload.tobytes()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self) -> None:
+        _path = self.path.split('?')[0]
+        if _path == '/stream' and 'websocket' in self.headers.get('Upgrade', '').lower():
+            self.server.stream._serve_viewer(self)
+            self.close_connection = True
+        elif _path == '/':
+            _body = _page.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(_body)))
+            self.end_headers()
+            self.wfile.write(_body)
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args) -> None:
+        # No log line per request
+        pass
+
+
+# Live view page, colors from blue to yellow scaled to the min/max of each frame
+_page = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>MVP3000 Live View</title>
+<style>
+body { font-family: sans-serif; margin: 1em; }
+canvas { width: 80vmin; height: 80vmin; image-rendering: pixelated; border: 1px solid #ccc; }
+</style></head>
+<body>
+<canvas id="view"></canvas>
+<p>Max fps <input id="fps" type="number" value="10" min="1" max="100" style="width: 4em">
+<span id="info"></span></p>
+<script>
+const canvas = document.getElementById('view');
+const context = canvas.getContext('2d');
+const info = document.getElementById('info');
+const fps = document.getElementById('fps');
+const stops = [[68, 1, 84], [59, 82, 139], [33, 145, 140], [94, 201, 98], [253, 231, 37]];
+let previous = null;
+let queue = Promise.resolve();
+let received = 0, bytes = 0, last = performance.now();
+
+const ws = new WebSocket(`ws://${location.host}/stream`);
+ws.binaryType = 'arraybuffer';
+const sendFps = () => ws.send(JSON.stringify({max_fps: Number(fps.value)}));
+ws.onopen = sendFps;
+fps.onchange = sendFps;
+ws.onclose = () => { info.textContent = 'Disconnected'; };
+// Messages are decoded in order, each delta needs the previous frame
+ws.onmessage = (event) => { queue = queue.then(() => show(event.data)); };
+
+async function inflate(buffer) {
+    const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return await new Response(stream).arrayBuffer();
+}
+
+async function show(buffer) {
+    const header = new DataView(buffer);
+    const type = header.getUint8(0), rows = header.getUint16(2, true), cols = header.getUint16(4, true);
+    const sequence = header.getUint32(6, true);
+    const words = new Uint32Array(await inflate(buffer.slice(18)));
+    if (type === 1) {
+        if (previous === null || previous.length !== words.length) return;
+        for (let i = 0; i < words.length; i++) words[i] ^= previous[i];
+    }
+    previous = words;
+    draw(new Float32Array(words.buffer), rows, cols);
+
+    received += 1; bytes += buffer.byteLength;
+    const now = performance.now();
+    if (now - last > 1000) {
+        info.textContent = `frame ${sequence}, ${(received * 1000 / (now - last)).toFixed(1)} fps, ${(bytes / (now - last)).toFixed(1)} kB/s`;
+        received = 0; bytes = 0; last = now;
+    }
+}
+
+function draw(values, rows, cols) {
+    if (canvas.width !== cols || canvas.height !== rows) { canvas.width = cols; canvas.height = rows; }
+    let min = Infinity, max = -Infinity;
+    for (const value of values) { if (value < min) min = value; if (value > max) max = value; }
+    const range = max > min ? max - min : 1;
+    const image = context.createImageData(cols, rows);
+    for (let i = 0; i < values.length; i++) {
+        const position = Math.min(Math.max((values[i] - min) / range, 0), 1) * (stops.length - 1);
+        const index = Math.min(Math.floor(position), stops.length - 2), fraction = position - index;
+        for (let c = 0; c < 3; c++) image.data[4 * i + c] = stops[index][c] + fraction * (stops[index + 1][c] - stops[index][c]);
+        image.data[4 * i + 3] = 255;
+    }
+    context.putImageData(image, 0, 0);
+}
+</script>
+</body></html>
+"""
@@ -0,0 +1,108 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+from collections import deque
+from threading import Condition
+
+
+class Subscription:
+    """
+    Frames for a single consumer. Each subscriber has its own buffer, reading never takes a frame from another one.
+    When the buffer is full:
+        keep_latest: single slot, a new frame replaces the unread one
+        drop_oldest: up to max_frames, the oldest unread frame is dropped
+        block: up to max_frames, the serial thread waits until the consumer has read, no frame is lost
+    Each frame comes as (sequence, timestamp_ns, frame). The sequence counts all frames of the device, a gap shows
+    frames dropped for this consumer. Frames are read-only, they are shared between subscribers.
+    """
+
+    policies = ('keep_latest', 'drop_oldest', 'block')
+
+    dropped: int = 0
+    closed: bool = False
+
+    _policy: str = 'keep_latest'
+    _frames: deque = None
+    _max_frames: int = 1
+    _condition: Condition = None
+
+
+    def __init__(self, policy: str = 'keep_latest', max_frames: int = 1) -> None:
+        if policy not in self.policies:
+            print("Warning: Unknown subscription policy, keeping latest.")
+            policy = 'keep_latest'
+        self._policy = policy
+        self._max_frames = 1 if policy == 'keep_latest' else max(max_frames, 1)
+        # Appending to a full deque with maxlen drops the oldest
+        self._frames = deque(maxlen=None if policy == 'block' else self._max_frames)
+        self._condition = Condition()
+
+    def put(self, sequence: int, timestamp_ns: int, frame: np.ndarray) -> None:
+        # Called from the serial thread
+        with self._condition:
+            if self._policy == 'block':
+                self._condition.wait_for(lambda: len(self._frames) < self._max_frames or self.closed)
+            if self.closed:
+                return
+            if len(self._frames) == self._max_frames:
+                self.dropped += 1
+            self._frames.append((sequence, timestamp_ns, frame))
+            self._condition.notify_all()
+
+    def put_batch(self, sequence: int, timestamp_ns: int, frames: np.ndarray) -> None:
+        # Several frames sharing the timestamp, sequence is that of the first, only the last fit if frames are dropped
+        if self._policy == 'block':
+            for i, _frame in enumerate(frames):
+                self.put(sequence + i, timestamp_ns, _frame)
+            return
+        with self._condition:
+            if self.closed:
+                return
+            _skipped = max(len(frames) - self._max_frames, 0)
+            self.dropped += _skipped + max(len(self._frames) + len(frames) - _skipped - self._max_frames, 0)
+            self._frames.extend((sequence + i, timestamp_ns, frames[i]) for i in range(_skipped, len(frames)))
+            self._condition.notify_all()
+
+    def get(self, timeout: float = None) -> tuple[int, int, np.ndarray]:
+        """
+        Oldest unread frame, waits up to timeout if there is none, zero does not wait. None on timeout or when closed.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self._frames) > 0 or self.closed, timeout):
+                return None
+            if len(self._frames) == 0:
+                return None
+            _item = self._frames.popleft()
+            self._condition.notify_all()
+            return _item
+
+    def get_all(self) -> list[tuple[int, int, np.ndarray]]:
+        # All unread frames, oldest first, without waiting
+        with self._condition:
+            _items = list(self._frames)
+            self._frames.clear()
+            self._condition.notify_all()
+            return _items
+
+    def pending(self) -> int:
+        return len(self._frames)
+
+    def close(self) -> None:
+        # Wakes waiting consumers and a blocked serial thread, later frames are ignored
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
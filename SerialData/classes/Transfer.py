@@ -0,0 +1,74 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+from SerialData.classes.Pipeline import batch_buffer
+
+
+class Transfer:
+    """
+    Per-element polynomial transfer function, evaluated for all elements at once with Horner's scheme.
+    Coefficients are one array, element shape after the first axis: center and inverse scale of the input, then the
+    polynomial coefficients from the highest power down, see Calibration.fit_polynomial. The input is normalized to
+    u = (x - center) * inverse_scale, which keeps the fit well conditioned.
+    Evaluation writes into preallocated buffers, or into out as a fused stage of a Pipeline, the returned array is
+    overwritten by the next call.
+    """
+
+    coefficients: np.ndarray = None
+    degree: int = 0
+    shape: tuple = None # Of a single frame
+
+    _u: np.ndarray = None
+    _result: np.ndarray = None
+    _batch_u: np.ndarray = None
+    _batch_result: np.ndarray = None
+
+
+    def __init__(self, coefficients: np.ndarray) -> None:
+        self.coefficients = np.asarray(coefficients, dtype=float)
+        # Linear at least, center and inverse scale come first
+        self.degree = len(self.coefficients) - 3
+        self.shape = self.coefficients.shape[1:]
+
+    def evaluate(self, data: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        Single frame or several frames, first axis is the frame index. Out may be data itself.
+        """
+        _u, _result = self._buffers(data.shape)
+        if out is not None:
+            _result = out
+        np.subtract(data, self.coefficients[0], out=_u)
+        np.multiply(_u, self.coefficients[1], out=_u)
+
+        # Horner: ((a_d * u + a_d-1) * u + ...) + a_0
+        np.multiply(_u, self.coefficients[2], out=_result)
+        np.add(_result, self.coefficients[3], out=_result)
+        for _coefficient in self.coefficients[4:]:
+            np.multiply(_result, _u, out=_result)
+            np.add(_result, _coefficient, out=_result)
+        return _result
+
+    def _buffers(self, shape: tuple) -> tuple[np.ndarray, np.ndarray]:
+        if len(shape) == len(self.shape):
+            if self._u is None:
+                self._u = np.zeros(shape)
+                self._result = np.zeros(shape)
+            return self._u, self._result
+        self._batch_u = batch_buffer(self._batch_u, shape)
+        self._batch_result = batch_buffer(self._batch_result, shape)
+        return self._batch_u[:shape[0]], self._batch_result[:shape[0]]
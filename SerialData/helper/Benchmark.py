@@ -0,0 +1,167 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+import json
+import numpy as np
+import os
+import platform
+import time
+from datetime import datetime
+from threading import Event
+
+from SerialData.SerialData import SerialData
+from SerialData.classes.Data import Data
+from SerialData.classes.DataMean import DataMean
+from SerialData.classes.FrameParser import FrameParser, _ansi_pattern, _csv_pattern
+from SerialData.classes.Noise import Noise
+from SerialData.classes.Pipeline import Pipeline
+
+
+class Benchmark:
+    """
+    Times each step of the per-frame path on its own and end to end, for a sweep of matrix sizes and frame counts.
+    Results are plain dicts to be stored as JSON and compared against a stored baseline.
+    """
+
+    shapes: list[tuple] = [(1, 3), (4, 4), (8, 8), (16, 16), (32, 32), (64, 64)]
+    frame_counts: list[int] = [100, 1000]
+    repeat: int = 3 # Best of
+
+
+    def run(self) -> dict:
+        _results = []
+        for _shape in self.shapes:
+            for _frame_count in self.frame_counts:
+                print(f"Benchmark {_shape[0]}x{_shape[1]}, {_frame_count} frames ...")
+                for _step, _ns in self._run_size(_shape, _frame_count).items():
+                    _results.append({'shape': list(_shape), 'frames': _frame_count, 'step': _step, 'us_per_frame': _ns / _frame_count / 1000})
+
+        return {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'processor': platform.processor(),
+            },
+            'results': _results,
+        }
+
+    def save(self, results: dict, filename: str) -> None:
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        with open(filename, 'w') as _file:
+            json.dump(results, _file, indent=1)
+        print(f"Benchmark saved to {filename}")
+
+    def load(self, filename: str) -> dict:
+        if os.path.exists(filename):
+            with open(filename) as _file:
+                return json.load(_file)
+        return None
+
+    def compare(self, results: dict, baseline: dict, threshold: float = 1.2) -> list[dict]:
+        """
+        Print the ratio to the baseline for each step, returns the steps slower than threshold times the baseline.
+        """
+        _baseline = {(tuple(_r['shape']), _r['frames'], _r['step']): _r['us_per_frame'] for _r in baseline['results']}
+        _regressions = []
+        print(f"{'shape':>7} {'frames':>6} {'step':<24} {'us/frame':>10} {'baseline':>10} {'ratio':>6}")
+        for _r in results['results']:
+            _key = (tuple(_r['shape']), _r['frames'], _r['step'])
+            if _key not in _baseline:
+                continue
+            _ratio = _r['us_per_frame'] / _baseline[_key] if _baseline[_key] > 0 else float('inf')
+            _flag = " <--" if _ratio > threshold else ""
+            print(f"{_key[0][0]:>3}x{_key[0][1]:<3} {_key[1]:>6} {_key[2]:<24} {_r['us_per_frame']:>10.2f} {_baseline[_key]:>10.2f} {_ratio:>6.2f}{_flag}")
+            if _ratio > threshold:
+                _regressions.append(dict(_r, baseline_us_per_frame=_baseline[_key], ratio=_ratio))
+        return _regressions
+
+    def _time(self, function, items) -> int:
+        # Best of repeats of calling function for all items, in ns
+        _best = None
+        for _ in range(self.repeat):
+            _start = time.perf_counter_ns()
+            for _item in items:
+                function(_item)
+            _elapsed = time.perf_counter_ns() - _start
+            _best = _elapsed if _best is None else min(_best, _elapsed)
+        return _best
+
+    def _run_size(self, shape: tuple, frame_count: int) -> dict:
+        _rng = np.random.default_rng(0)
+        _frames = _rng.integers(-500, 500, (frame_count,) + shape).astype(float)
+        _frames[_frames == 0] = 1 # Keep the reciprocal finite
+        _offset = np.zeros(shape)
+        _scaling = np.ones(shape)
+
+        # Lines as sent by the ESP with ANSI colors and log prefix
+        _payloads = [''.join(','.join(map(str, _row)) + ';' for _row in _frame.astype(int).tolist()) for _frame in _frames]
+        _lines = [f"\x1b[0;32m0:07:42 [D] {_payload}\x1b[0m\r\n".encode() for _payload in _payloads]
+        _clean_lines = [_ansi_pattern.sub('', _line.decode('utf-8').strip()) for _line in _lines]
+
+        _steps = {}
+        _steps['line_cleanup'] = self._time(lambda _line: _ansi_pattern.sub('', _line.decode('utf-8').strip()), _lines)
+        _steps['regex'] = self._time(lambda _line: _csv_pattern.search(_line), _clean_lines)
+        _steps['csv_to_array_generic'] = self._time(lambda _payload: FrameParser()._parse_generic(_payload), _payloads)
+        _parser = FrameParser()
+        _parser.parse(_clean_lines[0])
+        _steps['csv_to_array_cached'] = self._time(_parser.parse, _clean_lines)
+        _steps['csv_to_array_batch'] = self._time(lambda _lines: _parser.parse_batch(_lines), [_clean_lines])
+
+        # Empty pipeline as by default, a reciprocal as a plain function and as a fused stage
+        _steps['data_function'] = self._time(Pipeline().run, _frames)
+        _steps['data_function_reciprocal'] = self._time(lambda _frame: 1 / _frame, _frames)
+        _pipeline = Pipeline()
+        _pipeline.append('reciprocal', np.reciprocal)
+        _steps['pipeline_reciprocal'] = self._time(_pipeline.run, _frames)
+
+        _data = Data(_offset, _scaling)
+        _steps['data_update'] = self._time(_data.update, _frames)
+        _mean = DataMean(_offset, _scaling, 10, Event())
+        _steps['mean_update'] = self._time(_mean.update, _frames)
+        # Reads are cached per frame, each is timed together with the update of a new frame
+        _steps['data_update_scaled'] = self._time(lambda _frame: (_data.update(_frame), _data.scaled()), _frames)
+        _steps['data_update_minmax_forever_scaled'] = self._time(lambda _frame: (_data.update(_frame), _data.minmax_forever_scaled()), _frames)
+
+        # Noise measures a fixed count, thus a new one for each repeat
+        _best = None
+        for _ in range(self.repeat):
+            _noise = Noise(frame_count, Event())
+            _start = time.perf_counter_ns()
+            for _frame in _frames:
+                _noise.update(_frame, _frame)
+            _elapsed = time.perf_counter_ns() - _start
+            _best = _elapsed if _best is None else min(_best, _elapsed)
+        _steps['noise_update'] = _best
+
+        # Through a SerialData without device, once line by line and once in chunks
+        _serialData = SerialData('loop://', 10, threaded=False)
+        _steps['end_to_end_line'] = self._time(lambda _line: self._end_to_end_line(_serialData, _line), _lines)
+        _serialData._buffer = bytearray()
+        _chunks = self._chunks(b''.join(_lines), 4096)
+        _steps['end_to_end_chunked'] = self._time(_serialData._receive, _chunks)
+        _serialData.stop_serial()
+
+        return _steps
+
+    def _end_to_end_line(self, serialData: SerialData, line: bytes) -> None:
+        _data = serialData._parser.parse(line.decode('utf-8').strip())
+        if _data is not None:
+            serialData._process_frame(_data)
+
+    def _chunks(self, data: bytes, size: int) -> list[bytes]:
+        return [data[_start:_start + size] for _start in range(0, len(data), size)]
@@ -0,0 +1,111 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+
+# Standard deviation of a normal distribution per median absolute deviation
+_mad_to_sigma = 1.4826
+
+
+class Calibration:
+    """
+    Vectorized calibration of all elements of a frame at once, frame index first.
+    """
+
+    def clipped_mean(self, frames: np.ndarray, reject_sigma: float = 3.) -> np.ndarray:
+        '''
+        Mean of each element over the frames, leaving out values more than reject_sigma robust standard deviations
+        from the median. The robust deviation is from the median absolute deviation, or the standard deviation where
+        that is zero, e.g. for mostly identical integer values. None for a plain mean.
+        '''
+        if reject_sigma is None or len(frames) < 3:
+            return np.mean(frames, axis=0)
+        _median = np.median(frames, axis=0)
+        _deviation = np.abs(frames - _median)
+        _sigma = np.median(_deviation, axis=0) * _mad_to_sigma
+        _sigma = np.where(_sigma > 0, _sigma, np.std(frames, axis=0))
+        _keep = _deviation <= reject_sigma * _sigma
+        return np.sum(frames, axis=0, where=_keep) / np.sum(_keep, axis=0)
+
+    def flat_field(self, mean: np.ndarray, target = None) -> np.ndarray:
+        '''
+        Scaling that turns the offset corrected mean into the target, a uniform value, a reference frame, or by default
+        the median of the mean so a uniform stimulus reads flat. NaN where the mean is zero.
+        '''
+        if target is None:
+            target = np.median(mean)
+        _scaling = np.full(mean.shape, np.nan)
+        np.divide(target, mean, out=_scaling, where=mean != 0)
+        return _scaling
+
+    def fit_polynomial(self, inputs: np.ndarray, levels, degree: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Least-squares polynomial of each element from the input frames to the known stimulus levels, all elements at
+        once. Inputs are K frames, levels K values or K reference frames.
+        Returns the coefficients as used by Transfer, and the rms residual of each element in units of the levels.
+        '''
+        _inputs = np.asarray(inputs, dtype=float)
+        _count = len(_inputs)
+        _levels = np.broadcast_to(np.asarray(levels, dtype=float).reshape((_count,) + (1,) * (_inputs.ndim - 1)) if np.ndim(levels) == 1 else levels, _inputs.shape)
+
+        # Inputs normalized to about -1 ... 1 per element
+        _center = np.mean(_inputs, axis=0)
+        _half_range = (np.max(_inputs, axis=0) - np.min(_inputs, axis=0)) / 2
+        _inverse_scale = np.divide(1, _half_range, out=np.ones(_center.shape), where=_half_range > 0)
+        _u = ((_inputs - _center) * _inverse_scale).reshape(_count, -1).T
+
+        # Vandermonde matrix per element, highest power first, solved by batched pseudo-inverse
+        _vandermonde = _u[..., None] ** np.arange(degree, -1, -1)
+        _targets = _levels.reshape(_count, -1).T[..., None]
+        _fit = np.linalg.pinv(_vandermonde) @ _targets
+        _residual = np.sqrt(np.mean((_vandermonde @ _fit - _targets)[..., 0]**2, axis=1))
+
+        _coefficients = np.concatenate((_center[None], _inverse_scale[None], _fit[..., 0].T.reshape((degree + 1,) + _center.shape)))
+        return _coefficients, _residual.reshape(_center.shape)
+
+    def bad_pixels(self, frames: np.ndarray, residual: np.ndarray = None, reject_sigma: float = 5., uniform: bool = True) -> np.ndarray:
+        '''
+        Mask of elements that stand out from the others, True for bad. Checked per element are the noise, the range
+        between min and max over the frames, a stuck element has none, and the calibration residual if given. Only
+        give the residual of a fit with more levels than degree + 1, an exact fit leaves round-off only. With a
+        uniform stimulus, e.g. dark, also the mean, for hot or dead elements.
+        '''
+        _frames = np.asarray(frames, dtype=float)
+        _mask = self._outliers(np.std(_frames, axis=0), reject_sigma)
+        _mask |= self._outliers(np.max(_frames, axis=0) - np.min(_frames, axis=0), reject_sigma)
+        if uniform:
+            _mask |= self._outliers(np.mean(_frames, axis=0), reject_sigma)
+        if residual is not None:
+            # Only a large residual is bad
+            _mask |= self._outliers(residual, reject_sigma) & (residual > np.median(residual))
+        # Values that are not a number at all
+        _mask |= ~np.all(np.isfinite(_frames), axis=0)
+        return _mask
+
+    def _outliers(self, values: np.ndarray, reject_sigma: float) -> np.ndarray:
+        # More than reject_sigma robust standard deviations from the median, see clipped_mean
+        _finite = values[np.isfinite(values)]
+        if _finite.size == 0:
+            return np.zeros(values.shape, dtype=bool)
+        _median = np.median(_finite)
+        _sigma = np.median(np.abs(_finite - _median)) * _mad_to_sigma
+        if _sigma == 0:
+            _sigma = np.std(_finite)
+        with np.errstate(invalid='ignore'):
+            return np.abs(values - _median) > reject_sigma * _sigma
+
+calibration: Calibration = Calibration()
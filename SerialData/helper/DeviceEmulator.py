@@ -0,0 +1,199 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+import numpy as np
+import os
+import select
+import serial
+import time
+import tty
+from threading import Thread
+
+from SerialData.classes.BinaryParser import BinaryParser
+
+
+class DeviceEmulator:
+    """
+    Virtual device on a pseudo-terminal, SerialData opens its port like a real one. POSIX only.
+    Streams synthetic frames, or replays a captured raw byte log paced at a baud rate or at maximum speed.
+    Writes block once the reader falls behind and the terminal buffer is full, the emulator then runs late.
+    """
+
+    port: str = None
+
+    # Frames, including the dropped ones, or lines of a replay, log lines in between, and how far behind schedule
+    # writing is, max since start
+    frames_sent: int = 0
+    garbage_sent: int = 0
+    behind_max_ns: int = 0
+
+    _master: int = None
+    _slave: int = None
+    __stopped: bool = False
+
+    _shape: tuple = None
+    _rate: float = None
+    _noise: float = 0
+    _noise_model: str = None
+    _ansi: bool = False
+    _garbage: float = 0
+    _binary: bool = False
+    _drop: float = 0
+    _rng: np.random.Generator = None
+    _base: np.ndarray = None
+
+    _ansi_prefix = b'\x1b[0;32m'
+    _ansi_suffix = b'\x1b[0m'
+    _garbage_lines = [b'[I] WiFi reconnecting ...', b'[W] MQTT broker not available', b'[E] Sensor timeout', b'\x00\xff\xfe partial junk']
+
+
+    def __init__(self, shape: tuple = (4, 4), rate: float = 10, noise: float = 1, noise_model: str = 'gaussian',
+                 ansi: bool = False, garbage: float = 0, binary: bool = False, drop: float = 0, seed: int = None) -> None:
+        """
+        Shape of the matrix, rate in frames per second or None for maximum speed.
+        Noise model 'gaussian' or 'uniform' with noise as standard deviation, or 'none'.
+        Ansi wraps lines in color codes and a log prefix, garbage is the share of lines replaced by log messages.
+        Binary frames carry frames_sent as sequence number, drop is the share of frames silently not sent.
+        """
+        self._shape = shape
+        self._rate = rate
+        self._noise = noise
+        self._noise_model = noise_model
+        self._ansi = ansi
+        self._garbage = garbage
+        self._binary = binary
+        self._drop = drop
+        self._rng = np.random.default_rng(seed)
+        # Some pattern that makes the pixels distinguishable
+        self._base = 1000 + 10 * np.arange(np.prod(shape)).reshape(shape)
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+
+
+    def start(self) -> str:
+        self.__stopped = False
+        Thread(target=self._synthetic_thread).start()
+        print(f"Emulator started on {self.port}")
+        return self.port
+
+    def start_replay(self, filename: str, baudrate: int = 115200) -> str:
+        """
+        Replay a raw byte log, paced at the baud rate or at maximum speed if None.
+        """
+        with open(filename, 'rb') as _file:
+            _log = _file.read()
+        self.__stopped = False
+        Thread(target=self._replay_thread, args=(_log, baudrate)).start()
+        print(f"Emulator replaying {filename} on {self.port}")
+        return self.port
+
+    def stop(self, _ = None) -> None:
+        # Set stop flag for while loop, the thread closes the terminal
+        self.__stopped = True
+
+    def frame(self) -> np.ndarray:
+        if self._noise_model == 'gaussian':
+            _noise = self._rng.normal(0, self._noise, self._shape)
+        elif self._noise_model == 'uniform':
+            # Same standard deviation as gaussian
+            _limit = self._noise * np.sqrt(3)
+            _noise = self._rng.uniform(-_limit, _limit, self._shape)
+        else:
+            _noise = 0
+        return np.rint(self._base + _noise).astype(np.int32)
+
+    def line(self) -> bytes:
+        # Next line, counted as frame or garbage, only frames advance the sequence number
+        if self._garbage > 0 and self._rng.random() < self._garbage:
+            # Occasional log message instead of data
+            _line = self._garbage_lines[self._rng.integers(len(self._garbage_lines))]
+            self.garbage_sent += 1
+        elif self._binary:
+            _line = BinaryParser().encode(self.frame(), self.frames_sent)
+            self.frames_sent += 1
+            return _line
+        else:
+            _line = ''.join(','.join(map(str, _row)) + ';' for _row in self.frame().tolist()).encode()
+            self.frames_sent += 1
+
+        if self._ansi:
+            _line = self._ansi_prefix + time.strftime('%H:%M:%S').encode() + b' [D] ' + _line + self._ansi_suffix
+        return _line + b'\r\n'
+
+    def capture(self, port: str, filename: str, duration_s: float) -> None:
+        """
+        Record the raw bytes of a real device for later replay.
+        """
+        with serial.Serial(port, 115200, timeout=0.1) as _ser, open(filename, 'wb') as _file:
+            _end = time.monotonic() + duration_s
+            while time.monotonic() < _end:
+                _file.write(_ser.read(max(_ser.in_waiting, 1)))
+        print(f"Captured {port} to {filename}")
+
+    def _synthetic_thread(self) -> None:
+        _interval_ns = None if self._rate is None else int(1e9 / self._rate)
+        _next_ns = time.monotonic_ns() if _interval_ns is not None else 0
+        while self.__stopped is False:
+            _line = self.line()
+            if self._drop == 0 or self._rng.random() >= self._drop:
+                self._write(_line)
+            if _interval_ns is not None:
+                _next_ns += _interval_ns
+            self._wait_until(_next_ns)
+        self._close()
+
+    def _replay_thread(self, log: bytes, baudrate: int) -> None:
+        # Serial sends 10 bits per byte including start and stop bit
+        _chunk_size = 64
+        _chunk_ns = None if baudrate is None else int(_chunk_size * 10 * 1e9 / baudrate)
+        _next_ns = time.monotonic_ns() if _chunk_ns is not None else 0
+        for _start in range(0, len(log), _chunk_size):
+            if self.__stopped is True:
+                break
+            _chunk = log[_start:_start + _chunk_size]
+            self._write(_chunk)
+            self.frames_sent += _chunk.count(b'\n')
+            if _chunk_ns is not None:
+                _next_ns += _chunk_ns
+            self._wait_until(_next_ns)
+        self._close()
+
+    def _write(self, data: bytes) -> None:
+        # Non-blocking to still notice the stop flag when nobody reads
+        _view = memoryview(data)
+        while len(_view) > 0 and self.__stopped is False:
+            try:
+                _view = _view[os.write(self._master, _view):]
+            except BlockingIOError:
+                select.select([], [self._master], [], 0.1)
+
+    def _wait_until(self, next_ns: int) -> None:
+        # Maximum speed, never behind
+        if next_ns == 0:
+            return
+        _wait_ns = next_ns - time.monotonic_ns()
+        if _wait_ns > 0:
+            time.sleep(_wait_ns / 1e9)
+        else:
+            self.behind_max_ns = max(self.behind_max_ns, -_wait_ns)
+
+    def _close(self) -> None:
+        os.close(self._master)
+        os.close(self._slave)
+        print("Emulator stopped.")
@@ -0,0 +1,265 @@
+"""
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Iterable
+
+
+# Values per chunk when splitting an array along the sample axis, about 32 MB of float64
+_chunk_values = 2**22
+# Values per block processed at once, work arrays of about 2 MB stay in cache
+_block_values = 2**18
+# Pixels transformed at once in the power spectral density
+_fft_pixels = 64
+# Pixels per row from which the cumulative sum is faster added row by row
+_row_loop_pixels = 256
+
+
+class AllanDeviation:
+    """
+    Overlapping Allan deviation of all pixels at once, fed chunk by chunk with the sample index as first axis.
+    Averaging factors m are octaves 1, 2, 4, ... up to max_factor. Averaging windows are fully overlapping up to
+    overlap samples, beyond that they are spaced m / overlap apart with no visible loss in confidence.
+    The cumulative sum is kept in levels decimated by powers of two, each level only holds the tail it needs for the
+    next chunk and room for a few blocks, memory does not depend on the number of samples.
+    """
+
+    _rate: float = 1.
+    _overlap: int = 16
+    _factors: np.ndarray = None
+
+    _count: int = 0 # Samples so far
+    _offset: np.ndarray = None # Mean of the first chunk, removed to keep the cumulative sum small
+    _block_rows: int = 0
+
+    # Per level: cumulative sum at multiples of 2^level and the number of rows filled
+    _levels: list = None
+    _fills: list = None
+    _work: np.ndarray = None
+    _sums: np.ndarray = None
+    _terms: np.ndarray = None
+
+
+    def __init__(self, rate: float = 1., max_factor: int = 2**16, overlap: int = 16) -> None:
+        self._rate = rate
+        self._overlap = overlap
+        self._factors = 2**np.arange(int(np.log2(max_factor)) + 1)
+        self._terms = np.zeros(len(self._factors), dtype=np.int64)
+
+    def update(self, data: np.ndarray) -> None:
+        data = np.asarray(data, dtype=float)
+        data = data.reshape(len(data), -1)
+        if len(data) == 0:
+            return
+
+        if self._offset is None:
+            self._init_arrays(data)
+
+        # Blocks small enough for the work rows to stay in cache
+        for i in range(0, len(data), self._block_rows):
+            self._update_block(data[i:i + self._block_rows])
+
+    def _update_block(self, data: np.ndarray) -> None:
+        _rows = len(data)
+
+        # Cumulative sum continued from the last block, row k holds the sum of samples up to self._count - fill + k
+        _level = self._make_room(0, _rows)
+        _fill = self._fills[0]
+        _cumsum = _level[_fill:_fill + _rows]
+        np.subtract(data, self._offset, out=_cumsum)
+        np.add(_cumsum[0], _level[_fill - 1], out=_cumsum[0])
+        if _cumsum.shape[1] >= _row_loop_pixels:
+            # Row by row is several times faster than np.cumsum along the first axis for wide rows
+            for k in range(1, _rows):
+                np.add(_cumsum[k - 1], _cumsum[k], out=_cumsum[k])
+        else:
+            np.cumsum(_cumsum, axis=0, out=_cumsum)
+        self._update_level(0, _rows)
+
+        for _index in range(1, len(self._levels)):
+            # Decimated cumulative sum at multiples of the stride within this block
+            _new = _cumsum[-(self._count + 1) % 2**_index::2**_index]
+            _level = self._make_room(_index, len(_new))
+            _level[self._fills[_index]:self._fills[_index] + len(_new)] = _new
+            self._update_level(_index, len(_new))
+
+        self._count += _rows
+
+    def _update_level(self, index: int, new_rows: int) -> None:
+        _level = self._levels[index]
+        _start = self._fills[index]
+        _end = _start + new_rows
+
+        # Level 0 holds the fully overlapping octaves, each further level one octave with stride m / overlap
+        _quotients = self._factors[self._factors <= self._overlap] if index == 0 else [self._overlap]
+        for _q in _quotients:
+            # Second difference of the cumulative sum is m times the difference of adjacent averages,
+            # only terms ending in the new rows, the others were counted before
+            _first = max(_start - 2 * _q, 0)
+            if _end - 2 * _q <= _first:
+                continue
+            _average = np.subtract(_level[_first + _q:_end], _level[_first:_end - _q], out=self._work[:_end - _q - _first])
+            _difference = np.subtract(_average[_q:], _average[:-_q], out=_average[:-_q])
+            _octave = int(np.log2(_q)) + index
+            self._sums[_octave] += np.einsum('ij,ij->j', _difference, _difference)
+            self._terms[_octave] += len(_difference)
+
+        self._fills[index] = _end
+
+    def _make_room(self, index: int, new_rows: int) -> np.ndarray:
+        # Move the tail needed by the next terms to the front only once the level is full
+        _level = self._levels[index]
+        _fill = self._fills[index]
+        if _fill + new_rows > len(_level):
+            _keep = min(_fill, 2 * self._overlap)
+            _level[:_keep] = _level[_fill - _keep:_fill]
+            self._fills[index] = _keep
+        return _level
+
+    def _init_arrays(self, data: np.ndarray) -> None:
+        _tail = 2 * self._overlap
+        _pixels = data.shape[1]
+        self._offset = data.mean(axis=0)
+        self._block_rows = max(_block_values // _pixels, _tail)
+
+        # One level for the fully overlapping octaves and one for each larger octave, each with room for a few blocks
+        _level_count = max(len(self._factors) - int(np.log2(self._overlap)), 1)
+        self._levels = [np.zeros((_tail + 4 * (-(-self._block_rows // 2**i)), _pixels)) for i in range(_level_count)]
+        # Cumulative sum is zero before the first sample
+        self._fills = [1] * _level_count
+        self._work = np.zeros_like(self._levels[0])
+        self._sums = np.zeros((len(self._factors), _pixels))
+
+    def result(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Averaging time tau in seconds and Allan deviation with one column per pixel, octaves without any term are dropped.
+        """
+        _valid = self._terms > 0
+        _factors = self._factors[_valid]
+        _variance = self._sums[_valid] / (2. * _factors[:, np.newaxis]**2 * self._terms[_valid, np.newaxis])
+        return _factors / self._rate, np.sqrt(_variance)
+
+
+class WelchSpectrum:
+    """
+    Power spectral density of all pixels at once with Welch's method, fed chunk by chunk with the sample index as first axis.
+    Segments are Hann windowed with half overlap and the mean of each segment removed. Samples not filling a segment
+    are carried over to the next chunk.
+    """
+
+    _rate: float = 1.
+    _segment_length: int = 256
+    _window: np.ndarray = None
+    # Spectrum of the window, removing the segment mean only changes the few bins where it is not zero
+    _window_bins: np.ndarray = None
+    _window_spectrum: np.ndarray = None
+
+    _carry: np.ndarray = None
+    _buffer: np.ndarray = None
+    _sum: np.ndarray = None
+    _segments: int = 0
+
+
+    def __init__(self, rate: float = 1., segment_length: int = 256) -> None:
+        self._rate = rate
+        self._segment_length = segment_length
+        self._window = np.hanning(segment_length + 1)[:-1] # Periodic window
+
+        _spectrum = np.fft.rfft(self._window)
+        self._window_bins = np.flatnonzero(np.abs(_spectrum) > 1e-9 * np.abs(_spectrum).max())
+        self._window_spectrum = _spectrum[self._window_bins]
+
+    def update(self, data: np.ndarray) -> None:
+        data = np.asarray(data, dtype=float)
+        data = data.reshape(len(data), -1)
+        if self._carry is not None:
+            data = np.concatenate((self._carry, data))
+
+        _step = self._segment_length // 2
+        _count = (len(data) - self._segment_length) // _step + 1 if len(data) >= self._segment_length else 0
+        if _count > 0:
+            if self._sum is None:
+                self._sum = np.zeros((self._segment_length // 2 + 1, data.shape[1]))
+            _means = self._segment_means(data, _count, _step)
+
+            # All segments of the chunk at once: segment, pixel, sample, a few pixels at a time to stay in cache
+            _segments = sliding_window_view(data, self._segment_length, axis=0)[:_count * _step:_step]
+            for p in range(0, data.shape[1], _fft_pixels):
+                _block = _segments[:, p:p + _fft_pixels]
+                if self._buffer is None or self._buffer.shape[:2] != _block.shape[:2]:
+                    self._buffer = np.zeros(_block.shape)
+                np.multiply(_block, self._window, out=self._buffer)
+                _spectrum = np.fft.rfft(self._buffer, axis=2)
+                _spectrum[:, :, self._window_bins] -= _means[:, p:p + _fft_pixels, np.newaxis] * self._window_spectrum
+
+                # Squared magnitude summed over segments, real and imaginary parts are interleaved
+                _power = np.einsum('ijk,ijk->kj', _spectrum.view(float), _spectrum.view(float))
+                self._sum[:, p:p + _fft_pixels] += _power[0::2] + _power[1::2]
+            self._segments += _count
+
+        self._carry = data[_count * _step:].copy()
+
+    def _segment_means(self, data: np.ndarray, count: int, step: int) -> np.ndarray:
+        # Segments of two adjacent half blocks, plus the one sample left for odd lengths
+        _blocks = data[:(count + 1) * step].reshape(count + 1, step, -1).sum(axis=1)
+        _sums = _blocks[:-1] + _blocks[1:]
+        if self._segment_length % 2 == 1:
+            _sums += data[2 * step::step][:count]
+        return _sums / self._segment_length
+
+    def result(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Frequency in Hz and one-sided power spectral density with one column per pixel, in units^2/Hz.
+        """
+        _frequency = np.fft.rfftfreq(self._segment_length, 1. / self._rate)
+        if self._segments == 0:
+            return _frequency, None
+
+        _density = self._sum / (self._segments * self._rate * np.sum(self._window**2))
+        # One-sided, all but DC and Nyquist appear twice
+        _density[1:(self._segment_length + 1) // 2] *= 2
+        return _frequency, _density
+
+
+class NoiseAnalysis:
+    """
+    Allan deviation and power spectral density of an array such as Noise.data_historic or a memory mapped recording,
+    or of any iterable of chunks. Arrays are processed in chunks along the sample axis.
+    """
+
+    def allan_deviation(self, data: np.ndarray | Iterable[np.ndarray], rate: float = 1., max_factor: int = None) -> tuple[np.ndarray, np.ndarray]:
+        # Largest octave still leaving a term, unknown for iterables
+        if max_factor is None:
+            max_factor = max((len(data) - 1) // 2, 1) if isinstance(data, np.ndarray) else 2**16
+        _allan = AllanDeviation(rate, max_factor)
+        for _chunk in self._chunks(data):
+            _allan.update(_chunk)
+        return _allan.result()
+
+    def welch_psd(self, data: np.ndarray | Iterable[np.ndarray], rate: float = 1., segment_length: int = 256) -> tuple[np.ndarray, np.ndarray]:
+        _welch = WelchSpectrum(rate, segment_length)
+        for _chunk in self._chunks(data):
+            _welch.update(_chunk)
+        return _welch.result()
+
+    def _chunks(self, data: np.ndarray | Iterable[np.ndarray]) -> Iterable[np.ndarray]:
+        if not isinstance(data, np.ndarray):
+            return data
+        _rows = max(_chunk_values // max(data[0].size, 1), 1) if len(data) > 0 else 1
+        return (data[i:i + _rows] for i in range(0, len(data), _rows))
+
+noiseAnalysis: NoiseAnalysis = NoiseAnalysis()
@@ -0,0 +1,44 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+from datetime import datetime
+
+from SerialData.helper.Benchmark import Benchmark
+
+
+benchmark = Benchmark()
+### Reduce the sweep for a quick check
+# benchmark.shapes = [(1, 3), (32, 32)]
+# benchmark.frame_counts = [100]
+
+path_to_benchmark = "data/benchmark/"
+baseline_filename = f"{path_to_benchmark}baseline.json"
+
+results = benchmark.run()
+
+# Keep every run, machine-readable
+_timestamp = datetime.now().isoformat(timespec='seconds')
+benchmark.save(results, f"{path_to_benchmark}benchmark_{_timestamp}.json")
+
+baseline = benchmark.load(baseline_filename)
+if baseline is None:
+    # First run on this machine becomes the baseline
+    benchmark.save(results, baseline_filename)
+else:
+    regressions = benchmark.compare(results, baseline, threshold=1.2)
+    print(f"{len(regressions)} steps slower than 1.2x the baseline.")
+    ### Accept the current results as new baseline
+    # benchmark.save(results, baseline_filename)
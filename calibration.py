@@ -0,0 +1,67 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+import matplotlib.pyplot as plt
+
+from SerialData.SerialData import SerialData
+
+
+### Set up the serial connection (adjust the COM port and baud rate according to your configuration)
+serialData = SerialData('COM2')
+
+### Set a data function, default is lambda _data: _data
+# data_function = lambda _data: 1 / _data
+# serialData.set_data_function(data_function)
+
+# Wait for first data to arrive
+serialData.wait_for_serial()
+
+### Polynomial degree, needs at least degree + 1 levels
+degree = 2
+avg_count = 10
+
+# Measurement loop, one stimulus level at a time
+while True:
+    try:
+        user_level = input(f"Apply a known stimulus and enter its level, empty to fit ... (Ctrl-C to exit): ").strip()
+        if user_level == "":
+            break
+        level = float(user_level)
+    except ValueError:
+        continue
+    except KeyboardInterrupt:
+        serialData.stop_serial()
+        exit()
+
+    serialData.measure_calibration_point(level, avg_count)
+
+# Fit and apply to all following frames
+serialData.fit_calibration(degree)
+
+# Residual per element, outliers point to bad elements or levels, none if just degree + 1 levels
+if serialData.calibration_residual is not None:
+    fig, ax = plt.subplots()
+    image = ax.imshow(serialData.calibration_residual)
+    fig.colorbar(image)
+    ax.set_title("Calibration rms residual")
+    plt.show()
+
+# Save calibration, before closing as that finishes the file writes
+if serialData._transfer is not None:
+    serialData.save_calibration()
+
+# End thread and close serial
+serialData.stop_serial()
@@ -15,9 +15,11 @@ limitations under the License.
 """
 
 import matplotlib.pyplot as plt
-import time
+import numpy as np
+from datetime import datetime
 
 from SerialData.SerialData import SerialData
+from SerialData.classes.SessionRecorder import SessionRecorder
 
 
 ### Set up the serial connection (adjust the COM port and baud rate according to your configuration)
@@ -56,28 +58,36 @@ ax.yaxis.set_major_locator(plt.MaxNLocator(integer=True))
 plt.ion()
 plt.show()
 
+recorder = None
 try:
     # Catch Ctrl-C in input and during loop
     user_input = input("Description required (empty or Ctrl-C to exit): ").strip()
     if user_input == "":
         raise ValueError
 
+    # All averaged frames go to a single file, convert with export_csv.py if needed, written in the writer thread
+    recorder = SessionRecorder(f"{serialData.path_to_data}{user_input}_{datetime.now().isoformat(timespec='seconds')}", writer=serialData.writer)
+
     _counter = 0
     while True:
         _counter += 1
         print(f"Collecting data ... {_counter}")
         serialData.restart_data_acquisition()
         
-        while serialData._avg_count_reached_event.is_set() is False:
-            time.sleep(0.05)
+        serialData.wait_for_average()
 
 
         ### Select which data to use
         _data = serialData.mean
         # _data = serialData.mean
         ### Select raw, offset, scaling
-        # _array = _data.raw()
-        _array = _data.scaled()
+        # Data keeps updating in the background, copy the frame with its timestamp, again if one arrived meanwhile
+        while True:
+            _timestamp_ns = serialData.data.timestamp_ns()
+            # _array = np.array(_data.raw())
+            _array = np.array(_data.scaled())
+            if serialData.data.timestamp_ns() == _timestamp_ns:
+                break
         ### Select colorbar limits
         # _minmax = _data.minmax_raw()
         # _minmax = _data.minmax_scaled()
@@ -91,10 +101,13 @@ try:
         plt.pause(0.05)
 
         # Auto-save data
-        serialData.write_incremental_csv(_array, user_input)
+        recorder.record(_array, _timestamp_ns)
 
 except: # ValueError or KeyboardInterrupt
     print() # new line
 
+if recorder is not None:
+    recorder.close()
+
 # End thread and close serial
 serialData.stop_serial()
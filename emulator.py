@@ -0,0 +1,40 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+import time
+
+from SerialData.helper.DeviceEmulator import DeviceEmulator
+
+
+### Virtual device on a pseudo-terminal, open the printed port in any of the scripts instead of the real one (not on Windows)
+emulator = DeviceEmulator(shape=(8, 8), rate=10, noise=2)
+# emulator = DeviceEmulator(shape=(32, 32), rate=None, noise_model='uniform', ansi=True, garbage=0.01)
+# emulator = DeviceEmulator(shape=(32, 32), rate=50, binary=True)
+
+### Synthetic frames
+emulator.start()
+### Replay a captured raw byte log, paced at the baud rate or at maximum speed with None
+# emulator.capture('/dev/ttyACM0', "data/capture.bin", 60)
+# emulator.start_replay("data/capture.bin", 115200)
+
+try:
+    while True:
+        time.sleep(1)
+        print(f"Sent {emulator.frames_sent} frames, {emulator.garbage_sent} log lines, max {emulator.behind_max_ns / 1e6:.1f} ms behind (Ctrl-C to exit)", end='\r')
+except KeyboardInterrupt:
+    print() # new line
+
+emulator.stop()
@@ -0,0 +1,40 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+import numpy as np
+import sys
+
+from SerialData.classes.SessionReader import SessionReader
+
+
+### Recording to convert, filename without extension, e.g. data/description_2024-01-01T12:00:00
+filename = sys.argv[1] if len(sys.argv) > 1 else input("Recording to convert: ").strip()
+
+# Memory mapped, frames are read one at a time
+session = SessionReader(filename)
+### Select a time range, e.g. from 10 s to 20 s after the start, all frames if not given
+# _start_ns = int(session.timestamps()[0])
+# frames = session.time_range(_start_ns + 10 * 10**9, _start_ns + 20 * 10**9)
+frames = session.time_range()
+
+# One CSV per frame numbered from 1, same as SerialData.write_incremental_csv
+for i in range(frames.start, frames.stop):
+    np.savetxt(f"{filename}_{i + 1}.csv", session.frames[i], delimiter=",")
+    print(f"{i + 1}/{len(session)}", end='\r')
+
+# Arrival time in ns of time.monotonic_ns() and sequence number of each frame
+np.savetxt(f"{filename}_index.csv", np.column_stack((session.timestamps()[frames], session.sequence()[frames])), delimiter=",", fmt='%d', header="timestamp_ns,sequence")
+print(f"Exported {frames.stop - frames.start} frames of {filename}")
@@ -14,10 +14,8 @@ See the License for the specific language governing permissions and
 limitations under the License. 
 """
 
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-
 from SerialData.SerialData import SerialData
+from SerialData.classes.LiveView import LiveView
 
 
 ### Set up the serial connection (adjust the COM port and baud rate according to your configuration)
@@ -41,43 +39,22 @@ serialData.measure_offset()
 serialData.load_scaling()
 
 
-def update_plot(_):
-    """
-    Update function for the animation. Updates the imshow plot if new data is available.
-    """
-    if serialData.new_data_event.is_set():
-        serialData.new_data_event.clear()
-
-        ### Select which data to use
-        _data = serialData.data
-        # _data = serialData.mean
-        ### Select raw, offset, scaling
-        # _array = _data.raw()
-        _array = _data.scaled()
-        ### Select colorbar limits
-        # _minmax = _data.minmax_raw()
-        # _minmax = _data.minmax_scaled()
-        # _minmax = _data.minmax_forever_raw()
-        _minmax = _data.minmax_forever_scaled()
-
-        # Update graph data
-        im.set_array(_array)
-        im.set_clim(_minmax)
-
-    return im
-
+### Select which data to use, data and mean are re-created on restart
+_data = lambda: serialData.data
+# _data = lambda: serialData.mean
+### Select raw, offset, scaling
+# array = lambda: _data().raw()
+array = lambda: _data().scaled()
+### Select colorbar limits
+# minmax = lambda: _data().minmax_raw()
+# minmax = lambda: _data().minmax_scaled()
+# minmax = lambda: _data().minmax_forever_raw()
+minmax = lambda: _data().minmax_forever_scaled()
 
-# Initialize plot
-fig, ax = plt.subplots()
-fig.canvas.mpl_connect('close_event', serialData.stop_serial) # Exit thread with plot close
-im = ax.imshow(serialData.data.scaled(), aspect = 'auto', origin='upper', cmap='viridis', extent=(0.5, serialData.sizeX() + 0.5, serialData.sizeY() + 0.5, 0.5))
-# Show only the major ticks
-ax.xaxis.set_major_locator(plt.MaxNLocator(integer=True))
-ax.yaxis.set_major_locator(plt.MaxNLocator(integer=True))
-# Colorbar
-plt.colorbar(im, ax=ax, orientation="vertical")
+# Only the image is redrawn with each new frame, colorbar and fps every second
+liveView = LiveView(serialData, array, minmax, interval_ms=50, clim_interval_s=1.)
 
 # Start the live view
 print("Starting live view ... (close graph to exit)")
-ani = FuncAnimation(fig, update_plot, interval = 50)
-plt.show()
+liveView.show()
+print(liveView.stats())
@@ -14,10 +14,8 @@ See the License for the specific language governing permissions and
 limitations under the License. 
 """
 
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-
 from SerialData.SerialData import SerialData
+from SerialData.classes.LivePlot import LivePlot
 
 
 ### Set up the serial connection (adjust the COM port and baud rate according to your system configuration)
@@ -42,79 +40,18 @@ serialData.wait_for_serial()
 serialData.load_scaling()
 
 
-import numpy as np
-
-
-# Initialize plot
-fig, ax = plt.subplots(figsize=(4*3, 4*2))
-fig.canvas.mpl_connect('close_event', serialData.stop_serial) # Exit thread with plot close
-
-axes = [ax]
-for i in range(serialData.size - 1):
-    # Twin the x-axis for independent y-axes
-    axes.append(ax.twinx())
-    # Move the last y-axis spine over to the right by 20% of the width of the axes
-    axes[-1].spines['right'].set_position(('axes', 1 + i * 0.1))
-
-# Space on the right side for the extra y-axis
-fig.subplots_adjust(left=0.065, right=(1 - (serialData.size - 1) * 0.065))
-
-# Use the serial data counter to indicate omitted data points
-x_start = serialData._counter
-axes[0].set_xlabel('Data counter')
-
-lines = []
-for i, ax in enumerate(axes):
-    # Std matplotlib color palette
-    _color = plt.rcParams['axes.prop_cycle'].by_key()['color'][i]
-    # Plot line, returns a list of lines where we only need the first
-    lines.append( ax.plot(x_start, serialData.data.scaled().T[i], label=f"{i+1}", color=_color, linewidth=0.5)[0] )
-    # Color axis with plot
-    ax.tick_params(axis='y', colors=_color)
-
-# Add legend to first axis
-axes[0].legend(lines, [_line.get_label() for _line in lines], loc='upper center', bbox_to_anchor=(0.5, 1.1), fontsize= 'small', ncol=serialData.size)
-
-
-def update_plot(_):
-    """
-    Update function for the animation. Updates the imshow plot if new data is available.
-    """
-    global x_start
-    if serialData.new_data_event.is_set():
-        serialData.new_data_event.clear()
-
-        ### Select which data to use
-        _data = serialData.data
-        # _data = serialData.mean
-        ### Select raw, offset, scaling
-        # _array = _data.raw()
-        _array = _data.scaled()
-        ### Select colorbar limits
-        # _minmax = _data.minmax_raw()
-        # _minmax = _data.minmax_scaled()
-        # _minmax = _data.minmax_forever_raw()
-        _minmax = _data.minmax_forever_scaled()
-
-        # Update graph data
-        for i, (ax, line) in enumerate(zip(axes, lines)):
-            #print(line.get_data())
-            x, y = line.get_data()
-            x = np.concatenate([x, [serialData._counter]])
-            y = np.concatenate([y, _array.T[i]])
-            line.set_xdata(x)               
-            line.set_ydata(y)
-
-            #   
-            ax.set_ylim(0.95* _data.min_forever_scaled_array().T[i], 1.05 * _data.max_forever_scaled_array().T[i])
+### Time window in seconds, the history ring buffer needs to hold it at the frame rate of the device
+window_s = 60
+frame_rate = 100
+serialData.set_history(window_s * frame_rate)
 
-        # Update limits
-        plt.xlim(x_start, serialData._counter + 1)
-        # plt.ylim(_minmax)
+### Select which data to use: raw, offcor, scaled
+# data = 'raw'
+data = 'scaled'
 
-    return lines
+# Decimated to min/max per pixel column, y-axes are rescaled every second
+livePlot = LivePlot(serialData, data, window_s, interval_ms=100, autoscale_interval_s=1.)
 
 # Start the live view
 print("Starting live view ... (close graph to exit)")
-ani = FuncAnimation(fig, update_plot, interval = 250)
-plt.show()
+livePlot.show()
@@ -18,6 +18,7 @@ import matplotlib.pyplot as plt
 
 from SerialData.SerialData import SerialData
 from SerialData.helper.HelperMatrix import helperMatrix
+from SerialData.helper.NoiseAnalysis import noiseAnalysis
 
 
 ### Set up the serial connection (adjust the COM port and baud rate according to your configuration)
@@ -45,7 +46,18 @@ input("Press Enter to continue ...")
 ### Actual noise measurement
 noise_count = 10
 print("Calculating noise ...")
-serialData.measure_noise(noise_count)
+# Every frame is kept for the plots below, long measurements keep only every n-th frame, e.g. history_step=100
+serialData.measure_noise(noise_count, history_step=1)
+
+# Statistics are calculated over all frames, independent of the kept history
+print(f"Standard deviation per pixel: {serialData.noise.standard_deviation()}")
+print(f"Uncertainty per pixel: {serialData.noise.standard_uncertainty()}")
+# Frame intervals and dropped frames during acquisition
+print(serialData.timing.stats())
+
+# Sample rate of the kept history, needed for the time and frequency axis below
+frame_rate, _ = serialData.acquisition_stats()
+history_rate = frame_rate / (serialData.noise.x[0] if len(serialData.noise.x) > 0 else 1)
 
 # serialData.save_noise()
 
@@ -63,6 +75,30 @@ plt.grid(which='both')
 plt.legend()
 
 
+### Overlapping Allan deviation, unlike the uncertainty above it does not assume white noise
+# Also works on a memory mapped recording: noiseAnalysis.allan_deviation(np.load(filename, mmap_mode='r'), rate)
+tau, adev = noiseAnalysis.allan_deviation(serialData.noise.data_historic, history_rate)
+plt.figure()
+plt.title("Allan deviation.")
+plt.loglog(tau, adev, label=list(range(1, serialData.sizeX() * serialData.sizeY() + 1)) )
+plt.xlabel('Averaging time (s)')
+plt.ylabel('Allan deviation')
+plt.grid(which='both')
+plt.legend()
+
+
+### Power spectral density, Welch's method
+segment_length = min(256, len(serialData.noise.data_historic))
+frequency, psd = noiseAnalysis.welch_psd(serialData.noise.data_historic, history_rate, segment_length)
+plt.figure()
+plt.title("Power spectral density.")
+plt.loglog(frequency[1:], psd[1:], label=list(range(1, serialData.sizeX() * serialData.sizeY() + 1)) ) # Remove DC, the mean is removed
+plt.xlabel('Frequency (Hz)')
+plt.ylabel('PSD (1/Hz)')
+plt.grid(which='both')
+plt.legend()
+
+
 ### Display all vlaues/pixel as panels
 imgsX, imgsY, panel_count_per_fig = helperMatrix.split_figure(serialData.size)
 for i in range(serialData.size):
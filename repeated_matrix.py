@@ -15,7 +15,7 @@ limitations under the License.
 """
 
 import matplotlib.pyplot as plt
-import time
+import numpy as np
 
 from SerialData.SerialData import SerialData
 
@@ -61,16 +61,15 @@ while True:
     # Clear data and avg, but keep offset
     print("Collecting data ...")
     serialData.restart_data_acquisition()
-    while serialData._avg_count_reached_event.is_set() is False:
-        time.sleep(0.05)
+    serialData.wait_for_average()
 
 
     ### Select which data to use
     _data = serialData.data
     # _data = serialData.mean
-    ### Select raw, offset, scaling
-    _array = _data.raw()
-    # _array = _data.scaled()
+    ### Select raw, offset, scaling, data keeps updating in the background, keep a copy of this frame
+    _array = np.array(_data.raw())
+    # _array = np.array(_data.scaled())
     ### Select colorbar limits
     # _minmax = _data.minmax_raw()
     # _minmax = _data.minmax_scaled()
@@ -40,6 +40,12 @@ serialData.measure_offset(offset_count)
 scaling_count = 10
 serialData.load_scaling()
 
+### Flat field, all elements at once under a uniform stimulus, scaled to the median or to a target value or frame
+flat_field = False
+if flat_field:
+    input("Apply the uniform stimulus, then press Enter ...")
+    serialData.measure_flat_field(target=None, avg_count=scaling_count)
+
 
 # Prepare initial graph
 fig, ax = plt.subplots()
@@ -48,8 +54,8 @@ bars = plt.bar(list(range(1, serialData.size + 1)), serialData._scaling.flatten(
 plt.ion()
 plt.show()
 
-# Measurement loop
-pixel = 0
+# Measurement loop, one pixel at a time, skipped after the flat field
+pixel = serialData.size if flat_field else 0
 target_value = None
 while pixel < serialData.size:
     try:
@@ -86,11 +92,11 @@ while pixel < serialData.size:
     pixel += 1
 
 
+# Save scaling vector, before closing as that finishes the file writes
+serialData.save_scaling()
+
 # End thread and close serial
 serialData.stop_serial()
 
-# Save scaling vector
-serialData.save_scaling()
-
 # Output result for copy-paste
 print(f"scaling = {serialData._scaling.tolist()}")
@@ -0,0 +1,53 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+import multiprocessing
+import numpy as np
+
+from SerialData.classes.SharedAcquisition import SharedAcquisition
+from SerialData.classes.SharedData import SharedData
+
+
+def analysis(name: str) -> None:
+    """
+    Analysis process, attaches to the ring by name and uses data and mean like SerialData.
+    """
+    sharedData = SharedData(name, avg_count=100)
+    while not sharedData.stopped():
+        # Any heavy work here does not delay the acquisition, frames are dropped only if it is a full ring behind
+        if sharedData.wait_for_frames(timeout=1) == 0:
+            continue
+        _stats = sharedData.stats()
+        print(f"Mean {np.mean(sharedData.mean.scaled()):.3f}, {_stats['frames']} frames, {_stats['dropped']} dropped, latency {_stats['latency_last_ms']:.2f} ms", end='\r')
+    sharedData.close()
+
+
+if __name__ == '__main__':
+    ### Acquisition process (adjust the COM port according to your configuration), ring of the last 1024 frames
+    sharedAcquisition = SharedAcquisition('/dev/ttyACM0', avg_count=10, bulk_read=True, depth=1024)
+    name = sharedAcquisition.start()
+
+    ### Any number of analysis or display processes
+    worker = multiprocessing.Process(target=analysis, args=(name,))
+    worker.start()
+
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        print() # new line
+
+    sharedAcquisition.stop()
+    worker.join()
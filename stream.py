@@ -0,0 +1,52 @@
+""" 
+Copyright Production 3000
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. 
+"""
+
+import time
+
+from SerialData.SerialData import SerialData
+from SerialData.classes.StreamServer import StreamServer
+
+
+### Set up the serial connection (adjust the COM port and baud rate according to your configuration)
+serialData = SerialData('/dev/ttyACM0')
+
+# Wait for first data to arrive
+serialData.wait_for_serial()
+
+### Offset, unset is zero, should best be done on the ESP
+# serialData.measure_offset()
+# serialData.load_offset()
+### Scaling, unset is unity, should best be done on the ESP
+serialData.load_scaling()
+
+### Select which data to stream, computed from each published frame, default is scaled
+array = lambda _frame: (_frame + serialData._offset) * serialData._scaling
+# array = lambda _frame: _frame
+
+# Localhost only, on a headless device forward the port: ssh -L 8000:localhost:8000 device
+streamServer = StreamServer(serialData, array, host='127.0.0.1', port=8000, max_fps=30)
+streamServer.start()
+
+try:
+    while True:
+        time.sleep(1)
+        _stats = streamServer.stats()
+        print(f"{_stats['viewers']} viewers, {_stats['frames_sent']} frames, {_stats['bytes_sent'] / 1e6:.1f} MB sent (Ctrl-C to exit)", end='\r')
+except KeyboardInterrupt:
+    print() # new line
+
+streamServer.stop()
+serialData.stop_serial()